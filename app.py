@@ -1,34 +1,46 @@
 import json
-import rhino3dm
-from pathlib import Path
 
 from viktor import ViktorController, File
-from viktor.views import DataGroup, DataItem, GeoJSONAndDataResult, GeometryResult, TableResult, TableView, GeoJSONAndDataView, GeometryView, MapLabel
-from viktor.external.grasshopper import GrasshopperAnalysis
+from viktor.geometry import Point
+from viktor.views import DataGroup, DataItem, GeoJSONAndDataResult, GeometryResult, TableResult, TableView, GeoJSONAndDataView, GeometryView, MapLabel, Label
 from viktor.utils import memoize
 
-from gis_functions import get_gdf, create_legend, find_climate_zone
-from json_utils import parse_data_string, get_inner_tree_by_param_name
+from hops_jobs import get_scheduler
+from gis_functions import get_geojson_payload, get_climate_gdf, create_legend, find_climate_zone
+from design_pipeline import get_pipeline
+from design_atlas import get_atlas
+from climate_table import get_parameter_table
+from batch_screening import SUMMARY_COLUMNS, read_sites_csv, screen_sites, summary_table
 from parametrization import Parametrization
+from instrumentation import view_instrumented, payload_size
+from startup import PRELOAD, preload
 
 @memoize
 def memoized_grasshopper_analysis(json_input):
         #Funktion die die Grasshopper simulation ausführt
         #wird im Arbeitsspeicher zwischengespeichert       
         #Ergebnis kann deswegen mehrfach wieder aufgerufen werden
+        #Zusätzlich liegt jedes Ergebnis im Festplatten-Cache, der Neustarts und andere Worker überdauert
+        #Gleichzeitige Anfragen mit denselben Parametern teilen sich einen Job im Scheduler
 
         formatted_params = json.loads(json_input)
 
+        return get_scheduler().run(formatted_params)
 
-        #Festlegen wo das gh Skript liegt und übergeben der Hops-Parameter an das Skript
-        grasshopper_script_path = Path(__file__).parent / "files/Tinyhouse Generator.gh"
-        script = File.from_path(grasshopper_script_path)
+#Vorberechneter Entwurfsatlas wird beim Start geladen, ohne Atlas läuft alles über Hops
+get_atlas()
 
-        analysis = GrasshopperAnalysis(script=script, input_parameters=formatted_params)
-        #Analyse wird durchgeführt, sollte sie läger als 240 Sekunden dauern, wird sie angebrochen
-        analysis.execute(timeout=240)
+def atlas_labels(pipeline):
+    #Entwürfe aus dem Atlas wurden am repräsentativen Punkt ihrer Rasterzelle gerechnet, das steht als Label im Modell
+    note = pipeline.atlas_note
+    return [Label(Point(0, 0, 0), note)] if note else None
 
-        return analysis.get_output()
+#Optional alles Weitere schon jetzt laden, z.B. im Elternprozess bevor die Worker geforkt werden
+if PRELOAD:
+    preload()
+
+#Maximale Wartezeit des Standortvergleichs, danach werden Zwischenstände angezeigt
+BATCH_VIEW_TIMEOUT = 60
 
 class Controller(ViktorController):
     label = 'My Entity Type'
@@ -39,15 +51,15 @@ class Controller(ViktorController):
     #######################################################
 
     @GeoJSONAndDataView("Kartenansicht - Standortauswahl", duration_guess=1)
+    @view_instrumented
     def get_geojson_view(self, params, **kwargs) -> GeoJSONAndDataResult:
 
         #Kartenansicht mit GroJSON Overlay
 
-        gdf = get_gdf(params.step_1.styling)
-        geojson = json.loads(gdf.to_json())
-        gdf_labels = gdf.copy()
-        gdf_labels["label_geometry"] = gdf_labels.representative_point()
-        labels = [MapLabel(gdf_labels.label_geometry[0].x, gdf_labels.label_geometry[0].x, " ", 20)]
+        #GeoJSON wird pro Detailstufe nur einmal erzeugt und zwischengespeichert
+        payload = get_geojson_payload(params.step_1.styling)
+        label_point = payload.label_point
+        labels = [MapLabel(label_point.x, label_point.x, " ", 20)]
 
         #Festlegen der Position des Pins und das Styling des
 
@@ -74,7 +86,7 @@ class Controller(ViktorController):
         longitude = round(params.step_1.point.GeoPointField.lon, 3)
         latitude = round(params.step_1.point.GeoPointField.lat, 2)
 
-        selected_zone = find_climate_zone(gdf, latitude, longitude)
+        selected_zone = find_climate_zone(get_climate_gdf(), latitude, longitude)
 
         #Wurde eine Korrekte Klimazone ausgewählt?
         if selected_zone:
@@ -83,7 +95,8 @@ class Controller(ViktorController):
             climate_zone = f"Keine Klimazone am Punkt ({latitude}, {longitude}) gefunden"
 
         #Hinzufügen der Information zum View
-        geojson['features'].append(point_geojson)
+        geojson = payload.with_features(params.step_1.styling, point_geojson)
+        payload_size("view.get_geojson_view", geojson)
         data_items = DataItem("", climate_zone)
         attribute_results = DataGroup(data_items)
         legend = create_legend()
@@ -101,192 +114,96 @@ class Controller(ViktorController):
 
 
     @GeometryView("3D Modell Ansicht", duration_guess=10, x_axis_to_right=True, update_label='Simulation starten')
+    @view_instrumented
     def run_grasshopper(self, params, **kwargs):
         
         #Geometrieanzeige
-        #Zunächst initialisierung der Parameter
-        gdf = get_gdf(params.step_1.styling)
-        latitude = params.step_1.point.GeoPointField.lat
-        longitude = params.step_1.point.GeoPointField.lon
-        raumhoehe = params.step_2.geometrie.Raumhöhe
-        azimutRichtungEingang = params.step_2.geometrie.AzimutRichtungEingang
-        klimazone = find_climate_zone(gdf, latitude, longitude)
-
-        formatted_params = dict(
-            Raumhöhe=raumhoehe,
-            Längengrad=longitude,
-            Breitangrad=latitude,
-            Klimazone=klimazone,
-            AzimutRichtungEingang=azimutRichtungEingang
-        )
-
-        #Parameter in ein JSON String damit Hops sie lesen kann
-        json_input = json.dumps(formatted_params)
-
-        #memoized Function aufrufen für GH Skript, fragt immer vorher ab ob sich Parameter verändert haben
-        output = memoized_grasshopper_analysis(json_input)
-
-        file3dm = rhino3dm.File3dm()
-        geometry_inner_tree = get_inner_tree_by_param_name(output, "Geometry")
-
-        #Hinzufügen der Geometrien zum Viewmodel
-        def add_objects_to_model(inner_tree):
-            if not inner_tree:
-                print("Kein InnerTree gefunden.")
-                return
-            for key in inner_tree:
-                for data_item in inner_tree[key]:
-                    obj = rhino3dm.CommonObject.Decode(json.loads(data_item["data"]))
-                    file3dm.Objects.Add(obj)
-
-        add_objects_to_model(geometry_inner_tree)
-
-        geometry_file = File()
-        file3dm.Write(geometry_file.source, version=7)
-
-        return GeometryResult(geometry=geometry_file, geometry_type="3dm")
+        #Klimazone, Hops Analyse und .3dm Datei kommen aus der gemeinsamen Pipeline des Parametersatzes
+        pipeline = get_pipeline(params, memoized_grasshopper_analysis)
+        #Vorschau als GLB (nur Netze und Linien) für große Entwürfe oder wenn sie gewählt ist, sonst die exakte .3dm
+        modell = params.step_2.darstellung.modell or "Automatisch"
+        if modell == "Vorschau (glTF)" or (modell == "Automatisch" and pipeline.prefers_preview()):
+            geometry_data = pipeline.geometry_preview(params.step_2.darstellung.vereinfachung or 0.0)
+            geometry_type = "gltf"
+        else:
+            geometry_data = pipeline.geometry_model()
+            geometry_type = "3dm"
+        payload_size("view.run_grasshopper", geometry_data)
+        geometry_file = File.from_data(geometry_data)
+
+        return GeometryResult(geometry=geometry_file, labels=atlas_labels(pipeline), geometry_type=geometry_type)
 
     @GeometryView("Grundriss und Schnitte", duration_guess=10, x_axis_to_right=True, update_label='Lade aktuellen Grundriss', view_mode="2D")
+    @view_instrumented
     def view_floorplan(self, params, **kwargs):
 
         #2D View für Grundriss und Schnitte
-        #Zunächst initialisierung der Parameter
-        gdf = get_gdf(params.step_1.styling)
-        latitude = params.step_1.point.GeoPointField.lat
-        longitude = params.step_1.point.GeoPointField.lon
-        raumhoehe = params.step_2.geometrie.Raumhöhe
-        azimutRichtungEingang = params.step_2.geometrie.AzimutRichtungEingang
-        klimazone = find_climate_zone(gdf, latitude, longitude)
-
-        formatted_params = dict(
-            Raumhöhe=raumhoehe,
-            Längengrad=longitude,
-            Breitangrad=latitude,
-            Klimazone=klimazone,
-            AzimutRichtungEingang=azimutRichtungEingang
-        )
-
-        #Parameter in ein JSON String damit Hops sie lesen kann
-        json_input = json.dumps(formatted_params)
-
-        #memoized Function aufrufen für GH Skript, fragt immer vorher ab ob sich Parameter verändert haben
-        output = memoized_grasshopper_analysis(json_input)
-
-        file3dm = rhino3dm.File3dm()
-        floorplan_inner_tree = output["values"][2]["InnerTree"]
-
-        #Hinzufügen der Geometrien zum Viewmodel
-        def add_objects_to_model(inner_tree):
-            for key in inner_tree:
-                for data_item in inner_tree[key]:
-                    obj = rhino3dm.CommonObject.Decode(json.loads(data_item["data"]))
-                    file3dm.Objects.Add(obj)
-
-        add_objects_to_model(floorplan_inner_tree)
-
-        geometry_file = File()
-        file3dm.Write(geometry_file.source, version=7)
-        return GeometryResult(geometry=geometry_file, geometry_type="3dm")
+        pipeline = get_pipeline(params, memoized_grasshopper_analysis)
+        floorplan_data = pipeline.floorplan_model()
+        payload_size("view.view_floorplan", floorplan_data)
+        geometry_file = File.from_data(floorplan_data)
+        return GeometryResult(geometry=geometry_file, labels=atlas_labels(pipeline), geometry_type="3dm")
 
     ################################################
     # Views für Step 3 Beinhaltet Datenverarbeitung#
     ################################################
 
     @TableView("Informationen zur Parametrisierung", duration_guess=1)
+    @view_instrumented
     def run_data_analysis(self, params, **kwargs):
 
         #Tabelle für Datenansicht
-        #Zunächst initialisierung der Parameter
-        gdf = get_gdf(params.step_1.styling)
-        latitude = params.step_1.point.GeoPointField.lat
-        longitude = params.step_1.point.GeoPointField.lon
-        raumhoehe = params.step_2.geometrie.Raumhöhe
-        azimutRichtungEingang = params.step_2.geometrie.AzimutRichtungEingang
-        klimazone = find_climate_zone(gdf, latitude, longitude)
-
-        formatted_params = dict(
-            Raumhöhe=raumhoehe,
-            Längengrad=longitude,
-            Breitangrad=latitude,
-            Klimazone=klimazone,
-            AzimutRichtungEingang=azimutRichtungEingang
-        )
-
-        #Parameter in ein JSON String damit Hops sie lesen kann
-        json_input = json.dumps(formatted_params)
-
-        #memoized Function aufrufen für GH Skript, fragt immer vorher ab ob sich Parameter verändert haben
-        output = memoized_grasshopper_analysis(json_input)
-        text_inner_tree = get_inner_tree_by_param_name(output, "Tx")
-
-        #Hinzufügen der Infos zur richtigen Tabelle
-        if text_inner_tree and '{0}' in text_inner_tree:
-            #String aus dem Textdata bilden
-            text_data = text_inner_tree['{0}'][0]['data']
-            formatted_text = text_data.replace("\\r\\n", "\n").splitlines()
-
-            #"Parameter_data" aus dem String herauslesen (erste Ausgabe)
-            parameter_data, _ = parse_data_string(formatted_text)
-
-            #Tablle Vorbereiten und hinzufügen der Daten
-            table_data = []
-            row_headers = []
-            for key, value_dict in parameter_data.items():
-                row_headers.append(key)
-                table_data.append([value_dict["value"], value_dict["begründung"]])
-
-            return TableResult(table_data, column_headers=["Wert", "Begründung"], row_headers=row_headers)
-        else:
-            print("Keine Daten gefunden")
-            return TableResult([], column_headers=["Wert", "Begründung"], row_headers=[])
+        #Die Parameter kommen direkt aus der ClimateLookupTable, dafür wird keine Hops Analyse benötigt
+        #Nur für Klimazonen die dort fehlen wird auf den Text aus Grasshopper zurückgegriffen
+        pipeline = get_pipeline(params, memoized_grasshopper_analysis)
+        parameter_data = get_parameter_table(pipeline.klimazone) or pipeline.parameter_data
+
+        #Tablle Vorbereiten und hinzufügen der Daten
+        table_data = []
+        row_headers = []
+        for key, value_dict in parameter_data.items():
+            row_headers.append(key)
+            table_data.append([value_dict["value"], value_dict["begründung"]])
+        payload_size("view.run_data_analysis", table_data)
+
+        return TableResult(table_data, column_headers=["Wert", "Begründung"], row_headers=row_headers)
 
     @TableView("Wetterdaten", duration_guess=1)
+    @view_instrumented
     def run_weather_data(self, params, **kwargs):
 
         #Tabelle für Wetterdaten
-        #Zunächst initialisierung der Parameter
-        gdf = get_gdf(params.step_1.styling)
-        latitude = params.step_1.point.GeoPointField.lat
-        longitude = params.step_1.point.GeoPointField.lon
-        raumhoehe = params.step_2.geometrie.Raumhöhe
-        azimutRichtungEingang = params.step_2.geometrie.AzimutRichtungEingang
-        klimazone = find_climate_zone(gdf, latitude, longitude)
-
-        formatted_params = dict(
-            Raumhöhe=raumhoehe,
-            Längengrad=longitude,
-            Breitangrad=latitude,
-            Klimazone=klimazone,
-            AzimutRichtungEingang=azimutRichtungEingang
-        )
-
-        #Parameter in ein JSON String damit Hops sie lesen kann
-        json_input = json.dumps(formatted_params)
-
-        #memoized Function aufrufen für GH Skript, fragt immer vorher ab ob sich Parameter verändert haben
-        output = memoized_grasshopper_analysis(json_input)
-        text_inner_tree = get_inner_tree_by_param_name(output, "Tx")
-
-        #Hinzufügen der Infos zur richtigen Tabelle
-        if text_inner_tree and '{0}' in text_inner_tree:
-            #String aus dem Textdata bilden
-            text_data = text_inner_tree['{0}'][0]['data']
-            formatted_text = text_data.replace("\\r\\n", "\n").splitlines()
-
-            #"wetterdaten" aus dem String herauslesen (zweite Ausgabe)
-            _, wetterdaten = parse_data_string(formatted_text)
-
-            #Tablle Vorbereiten und hinzufügen der Daten
-            table_data = []
-            row_headers = []
-            for monat, daten in wetterdaten.items():
-                row_headers.append(monat)
-                table_data.append([
-                    daten.get("Schneefall [mm]", 0),
-                    daten.get("Niederschlag [mm]", 0)
-                ])
-
-            return TableResult(table_data, column_headers=["Schneefall [mm]", "Niederschlag [mm]"], row_headers=row_headers)
-        else:
-            print("Keine Daten gefunden")
-            return TableResult([], column_headers=["Schneefall [mm]", "Niederschlag [mm]"], row_headers=[])
\ No newline at end of file
+        wetterdaten = get_pipeline(params, memoized_grasshopper_analysis).wetterdaten
+
+        #Tablle Vorbereiten und hinzufügen der Daten
+        table_data = []
+        row_headers = []
+        for monat, daten in wetterdaten.items():
+            row_headers.append(monat)
+            table_data.append([
+                daten.get("Schneefall [mm]", 0),
+                daten.get("Niederschlag [mm]", 0)
+            ])
+        payload_size("view.run_weather_data", table_data)
+
+        return TableResult(table_data, column_headers=["Schneefall [mm]", "Niederschlag [mm]"], row_headers=row_headers)
+
+    ################################################
+    # Views für Step 4 Beinhaltet Standortvergleich#
+    ################################################
+
+    @TableView("Standortvergleich", duration_guess=10, update_label='Standorte auswerten')
+    @view_instrumented
+    def run_batch_screening(self, params, **kwargs):
+
+        #Tabelle mit allen Standorten aus der hochgeladenen CSV
+        #Noch laufende Analysen erscheinen mit ihrem Status, ein erneutes Laden zeigt den neuen Stand
+        if not params.step_4.standorte.csv_file:
+            return TableResult([], column_headers=SUMMARY_COLUMNS, row_headers=[])
+
+        sites = read_sites_csv(params.step_4.standorte.csv_file.file.getvalue_binary())
+        results = screen_sites(sites, timeout=BATCH_VIEW_TIMEOUT)
+        table_data, column_headers = summary_table(results)
+        payload_size("view.run_batch_screening", table_data)
+
+        return TableResult(table_data, column_headers=column_headers, row_headers=[str(i + 1) for i in range(len(table_data))])
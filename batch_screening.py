@@ -0,0 +1,171 @@
+import io
+import csv
+from concurrent.futures import as_completed, TimeoutError as FuturesTimeoutError
+
+from viktor.errors import UserError
+
+from gis_functions import get_climate_gdf, find_climate_zones
+from hops_jobs import get_batch_scheduler
+from hops_params import normalize_hops_params
+from json_utils import parse_text_output
+
+
+#Standardwerte wie in der Parametrisierung, falls eine Spalte in der CSV fehlt
+DEFAULT_RAUMHOEHE = 2.5
+DEFAULT_AZIMUT = 90.0
+
+#Erlaubte Spaltennamen der CSV, Groß-/Kleinschreibung spielt keine Rolle
+COLUMN_ALIASES = {
+    "lat": ("lat", "latitude", "breitengrad", "breitangrad"),
+    "lon": ("lon", "lng", "longitude", "längengrad", "laengengrad"),
+    "raumhoehe": ("raumhöhe", "raumhoehe"),
+    "azimut": ("azimut", "azimutrichtungeingang", "azimuth"),
+}
+
+SUMMARY_COLUMNS = ["Breitengrad", "Längengrad", "Raumhöhe", "Azimut", "Klimazone", "Status"]
+
+
+def _to_float(value):
+    #ValueError bei fehlenden oder nicht lesbaren Werten, auch für zu kurze Zeilen (value ist dann None)
+    if value is None or not str(value).strip():
+        raise ValueError("Wert fehlt")
+    return float(str(value).strip().replace(",", "."))
+
+def read_sites_csv(source) -> list:
+    #Liest Standorte aus einer CSV (Text, Bytes oder Dateiobjekt), Trennzeichen ";" oder ","
+    #Zeilen mit fehlenden oder ungültigen Werten werden mit "error" markiert statt die ganze Datei abzulehnen
+    if hasattr(source, "read"):
+        source = source.read()
+    if isinstance(source, bytes):
+        try:
+            source = source.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise UserError("Die CSV muss UTF-8 kodiert sein")
+    source = source.lstrip("\ufeff")
+
+    lines = [line for line in source.splitlines() if line.strip()]
+    if not lines:
+        raise UserError("Die CSV ist leer")
+    try:
+        dialect = csv.Sniffer().sniff(lines[0], delimiters=";,\t")
+    except csv.Error:
+        #Nur eine Spalte oder unbekanntes Trennzeichen, die Spaltenprüfung unten meldet den Fehler
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(source), dialect=dialect)
+
+    columns = {}
+    for field_name in reader.fieldnames or []:
+        for column, aliases in COLUMN_ALIASES.items():
+            if field_name and field_name.strip().lower() in aliases:
+                columns[column] = field_name
+    missing = [column for column in ("lat", "lon") if column not in columns]
+    if missing:
+        raise UserError(f"Die CSV benötigt die Spalten lat und lon, es fehlt: {', '.join(missing)}. "
+                        f"Gefundene Spalten: {', '.join(name for name in reader.fieldnames or [] if name) or 'keine'}")
+
+    sites = []
+    for row in reader:
+        if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+            continue
+        site = {"lat": None, "lon": None, "raumhoehe": DEFAULT_RAUMHOEHE, "azimut": DEFAULT_AZIMUT, "error": None}
+        errors = []
+        for column in ("lat", "lon", "raumhoehe", "azimut"):
+            if column not in columns:
+                continue
+            value = row.get(columns[column])
+            if column in ("raumhoehe", "azimut") and not (value or "").strip():
+                continue
+            try:
+                site[column] = _to_float(value)
+            except ValueError:
+                errors.append(f"{columns[column]} {'fehlt' if not (value or '').strip() else f'ungültig ({value.strip()})'}")
+        if not errors and not (-90 <= site["lat"] <= 90 and -180 <= site["lon"] <= 180):
+            errors.append("Koordinaten außerhalb des gültigen Bereichs")
+        if errors:
+            site["error"] = f"Zeile {reader.line_num}: " + ", ".join(errors)
+        sites.append(site)
+    return sites
+
+
+def screen_sites(sites, scheduler=None, timeout=None):
+    #Bewertet viele Standorte auf einmal und liefert (index, zeile) in der Reihenfolge, in der sie fertig werden
+    #Alle Punkte werden in einer Abfrage den Klimazonen zugeordnet, Zeilen mit identischen
+    #Hops-Eingaben teilen sich eine Analyse, die eindeutigen Analysen laufen parallel im Scheduler
+    #für Stapelauswertungen, die interaktiven Views behalten so ihre eigenen Worker
+    #Nach timeout Sekunden werden noch laufende Analysen mit ihrem Status zurückgegeben
+    scheduler = scheduler if scheduler is not None else get_batch_scheduler()
+    valid = [site for site in sites if not site.get("error")]
+    zones = iter(find_climate_zones(get_climate_gdf(), [site["lat"] for site in valid], [site["lon"] for site in valid]))
+
+    #Job-ID -> (Job, Zeilen); die Jobs selbst werden gehalten, da der Scheduler abgeschlossene Jobs vergisst
+    rows_by_job = {}
+    for index, site in enumerate(sites):
+        row = {
+            "Breitengrad": "" if site["lat"] is None else site["lat"],
+            "Längengrad": "" if site["lon"] is None else site["lon"],
+            "Raumhöhe": site["raumhoehe"],
+            "Azimut": site["azimut"],
+            "Klimazone": "",
+        }
+        if site.get("error"):
+            row["Status"] = f"Ungültige Zeile: {site['error']}"
+            yield index, row
+            continue
+        klimazone = next(zones)
+        row["Klimazone"] = klimazone or ""
+        if klimazone is None:
+            row["Status"] = "Keine Klimazone"
+            yield index, row
+            continue
+
+        formatted_params = normalize_hops_params(dict(
+            Raumhöhe=site["raumhoehe"],
+            Längengrad=site["lon"],
+            Breitangrad=site["lat"],
+            Klimazone=klimazone,
+            AzimutRichtungEingang=site["azimut"]
+        ))
+        job = scheduler.submit_job(formatted_params)
+        rows_by_job.setdefault(job.key, (job, []))[1].append((index, row))
+
+    jobs = {job.future: job for job, _ in rows_by_job.values()}
+    pending = set(rows_by_job)
+    try:
+        for future in as_completed(jobs, timeout=timeout):
+            job = jobs[future]
+            pending.discard(job.key)
+            yield from _finished_rows(job, rows_by_job[job.key][1])
+    except FuturesTimeoutError:
+        for job_id in pending:
+            job, rows = rows_by_job[job_id]
+            status = job.to_dict()
+            for index, row in rows:
+                row["Status"] = f"läuft ({status['progress']:.0%})"
+                yield index, row
+
+def _finished_rows(job, rows):
+    try:
+        output = job.get_result()
+        parameter_data, _ = parse_text_output(output)
+        status = "fertig"
+    except Exception as error:
+        parameter_data = {}
+        status = f"Fehler: {error}"
+
+    for index, row in rows:
+        row["Status"] = status
+        for key, value_dict in parameter_data.items():
+            row[key] = value_dict["value"]
+        yield index, row
+
+
+def summary_table(results):
+    #Fasst die Zeilen aus screen_sites in Eingabereihenfolge zu einer Tabelle zusammen
+    rows = [row for _, row in sorted(results, key=lambda result: result[0])]
+    column_headers = list(SUMMARY_COLUMNS)
+    for row in rows:
+        for key in row:
+            if key not in column_headers:
+                column_headers.append(key)
+    table_data = [[row.get(column, "") for column in column_headers] for row in rows]
+    return table_data, column_headers
@@ -0,0 +1,82 @@
+import json
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+
+#Binäres Spaltenformat der Köppen-Geiger Polygone, erzeugt mit scripts/build_climate_store.py
+#Koordinaten, Offsets (shapely ragged array) und Zonen-Codes liegen als .npy Dateien vor und werden
+#per Memory Mapping gelesen, die Namen der Zonen und die Herkunft stehen in meta.json
+#Das Format verkürzt vor allem die Ladezeit: GEOS kopiert die Koordinaten beim Erzeugen der Polygone immer
+#in eigene Objekte (float64, ~2.7 MB), auch float64 Dateien würden das nicht vermeiden
+#Ohne Kopie im Speicher bleiben nur die Zonen-Codes
+STORE_FORMAT = 1
+META_FILE = "meta.json"
+COORDINATES_FILE = "coordinates.npy"
+ZONE_CODES_FILE = "zone_codes.npy"
+
+
+def file_digest(path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+def _coordinate_scale(coordinates):
+    #Liegen alle Koordinaten auf einem festen Raster, werden sie als int16 mit Faktor gespeichert
+    for scale in (1, 10, 100):
+        scaled = np.round(coordinates * scale)
+        if np.abs(scaled).max() < np.iinfo(np.int16).max and np.array_equal(scaled / scale, coordinates):
+            return scale
+    return None
+
+def write_climate_store(geometries, climate, directory, source_path=None, crs="EPSG:4326") -> dict:
+    #geometries: shapely Array, climate: Zonenname pro Polygon
+    import shapely
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    geometry_type, coordinates, offsets = shapely.to_ragged_array(geometries)
+
+    scale = _coordinate_scale(coordinates)
+    if scale is not None:
+        stored_coordinates = np.round(coordinates * scale).astype(np.int16)
+    else:
+        stored_coordinates = coordinates.astype(np.float64)
+    np.save(directory / COORDINATES_FILE, stored_coordinates)
+    for index, offset in enumerate(offsets):
+        np.save(directory / f"offsets_{index}.npy", offset.astype(np.int32))
+
+    zones = sorted(set(climate))
+    if len(zones) > np.iinfo(np.int8).max:
+        raise ValueError("Zu viele Klimazonen für int8 Codes")
+    zone_index = {zone: code for code, zone in enumerate(zones)}
+    np.save(directory / ZONE_CODES_FILE, np.array([zone_index[zone] for zone in climate], dtype=np.int8))
+
+    meta = {
+        "format": STORE_FORMAT,
+        "geometry_type": int(geometry_type),
+        "offsets": len(offsets),
+        "coordinate_scale": scale,
+        "crs": crs,
+        "zones": zones,
+        "source_sha256": file_digest(source_path) if source_path else None,
+    }
+    (directory / META_FILE).write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    return meta
+
+def read_climate_store(directory):
+    #Gibt (geometries, codes, zones, meta) zurück, codes ist int8 und bleibt ein Memory Map
+    #Die Koordinaten werden vollständig gelesen und von shapely kopiert, das Memory Mapping spart hier nur das Einlesen
+    import shapely
+
+    directory = Path(directory)
+    meta = json.loads((directory / META_FILE).read_text(encoding="utf-8"))
+    if meta.get("format") != STORE_FORMAT:
+        raise ValueError(f"Unbekanntes Format {meta.get('format')} in {directory}")
+
+    coordinates = np.load(directory / COORDINATES_FILE, mmap_mode="r")
+    if meta["coordinate_scale"]:
+        coordinates = coordinates / meta["coordinate_scale"]
+    offsets = tuple(np.load(directory / f"offsets_{index}.npy", mmap_mode="r") for index in range(meta["offsets"]))
+    geometries = shapely.from_ragged_array(shapely.GeometryType(meta["geometry_type"]), np.asarray(coordinates), offsets)
+    codes = np.load(directory / ZONE_CODES_FILE, mmap_mode="r")
+    return geometries, codes, meta["zones"], meta
@@ -0,0 +1,65 @@
+import csv
+import threading
+from pathlib import Path
+
+
+CLIMATE_TABLE_PATH = Path(__file__).parent / "files/ClimateLookupTable.csv"
+
+#Welche Erklärungsspalte die Begründung zu einem Parameter liefert
+EXPLANATION_COLUMNS = {
+    "Tragwerk": "Erklärung Tragwerk",
+    "Belüftet": "Erklärung Belüftet",
+    "Dach": "Erklärung Dach",
+    "WWR Nord": "Erklärung WWR",
+    "WWR Ost": "Erklärung WWR",
+    "WWR Süd": "Erklärung WWR",
+    "WWR West": "Erklärung WWR",
+    "Seitenverältnis y / x": "Erklärung Seitenverältnis y / x",
+}
+
+
+class ClimateTable:
+    #Regeln pro Klimazone aus der ClimateLookupTable.csv, die auch das Grasshopper Skript verwendet
+    #Einmal eingelesen und nach Klimazone (voller Name und Kürzel wie "Cfb") indiziert
+
+    def __init__(self, path=CLIMATE_TABLE_PATH):
+        self.path = Path(path)
+        self._stamp = None
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        stat = self.path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return self._index
+
+        index = {}
+        with open(self.path, newline="", encoding="utf-8-sig") as csv_file:
+            for row in csv.DictReader(csv_file, delimiter=";"):
+                zone = row.pop("Klimazone").strip()
+                explanations = {key: row.pop(key) for key in list(row) if key.startswith("Erklärung")}
+                parameter_data = {}
+                for key, value in row.items():
+                    begründung = explanations.get(EXPLANATION_COLUMNS.get(key), "")
+                    parameter_data[key] = {"value": value.strip(), "begründung": begründung.strip()}
+                index[zone] = parameter_data
+                index.setdefault(zone.split()[0], parameter_data)
+
+        self._index = index
+        self._stamp = stamp
+        return index
+
+    def get(self, klimazone) -> dict:
+        #Parameter wie parse_data_string sie liefert: {name: {"value": ..., "begründung": ...}}
+        #Leeres Dict für unbekannte Klimazonen
+        if not klimazone:
+            return {}
+        with self._lock:
+            index = self._load()
+        return index.get(klimazone.strip(), {})
+
+_climate_table = ClimateTable()
+
+def get_parameter_table(klimazone) -> dict:
+    return _climate_table.get(klimazone)
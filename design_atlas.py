@@ -0,0 +1,172 @@
+import os
+import json
+import math
+import zlib
+import sqlite3
+import threading
+from pathlib import Path
+
+from hops_cache import script_fingerprint
+from hops_params import RAUMHOEHE_DECIMALS, normalize_hops_params
+
+
+#Vorberechneter Entwurfsatlas, erzeugt offline mit scripts/build_atlas.py
+ATLAS_PATH = Path(os.environ.get("TINYHOUSE_ATLAS_PATH", Path(__file__).parent / "files/design_atlas.sqlite"))
+
+#Raster des Atlas: Raumhöhe wie der Slider, Koordinaten in Zellen, Azimut nur auf den Rasterwerten
+#Andere Azimute rechnet Hops, mit scripts/build_atlas.py --azimut-schritt 1 deckt der Atlas jeden Sliderwert ab
+ATLAS_RAUMHOEHEN = tuple(round(2.3 + 0.1 * i, RAUMHOEHE_DECIMALS) for i in range(18))
+ATLAS_AZIMUT_STEP = 45
+ATLAS_CELL_DEGREES = 5.0
+
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    klimazone TEXT NOT NULL,
+    cell_lat INTEGER NOT NULL,
+    cell_lon INTEGER NOT NULL,
+    raumhoehe REAL NOT NULL,
+    azimut REAL NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    geometry BLOB,
+    floorplan BLOB,
+    parameter_data TEXT,
+    wetterdaten TEXT,
+    PRIMARY KEY (klimazone, cell_lat, cell_lon, raumhoehe, azimut)
+) WITHOUT ROWID;
+"""
+
+
+def azimut_bucket(azimut, step=ATLAS_AZIMUT_STEP):
+    #Azimut wie ihn Hops bekommt, None wenn er nicht auf dem Raster des Atlas liegt
+    #Es wird nicht gerundet: ein Eingang 20° neben dem Slider wäre ohne Hinweis ein anderer Entwurf
+    azimut = normalize_hops_params(dict(AzimutRichtungEingang=azimut))["AzimutRichtungEingang"]
+    return float(azimut) if azimut % step == 0 else None
+
+def coordinate_cell(latitude, longitude, cell_degrees=ATLAS_CELL_DEGREES):
+    #Index der Rasterzelle, in der ein Punkt liegt
+    return math.floor(float(latitude) / cell_degrees), math.floor(float(longitude) / cell_degrees)
+
+def atlas_key(klimazone, latitude, longitude, raumhoehe, azimut, cell_degrees=ATLAS_CELL_DEGREES, azimut_step=ATLAS_AZIMUT_STEP):
+    #Schlüssel eines Entwurfs im Atlas: (Klimazone, Zelle, Raumhöhe, Azimut), None für Azimute neben dem Raster
+    azimut = azimut_bucket(azimut, azimut_step)
+    if azimut is None:
+        return None
+    cell_lat, cell_lon = coordinate_cell(latitude, longitude, cell_degrees)
+    return (klimazone, cell_lat, cell_lon, round(float(raumhoehe), RAUMHOEHE_DECIMALS), azimut)
+
+def pack_blob(data: bytes) -> bytes:
+    return zlib.compress(data, 9)
+
+def unpack_blob(data) -> bytes:
+    return zlib.decompress(data)
+
+def open_atlas_db(path, readonly=False) -> sqlite3.Connection:
+    if readonly:
+        return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class DesignAtlas:
+    #Liest den Atlas: die Schlüssel aller fertigen Entwürfe werden beim Start geladen,
+    #.3dm Dateien und Tabellen erst beim Zugriff aus der SQLite Datei
+
+    def __init__(self, path=ATLAS_PATH):
+        self.path = Path(path)
+        self._connection = open_atlas_db(self.path, readonly=True)
+        self._lock = threading.Lock()
+        meta = dict(self._connection.execute("SELECT name, value FROM meta"))
+        self.cell_degrees = float(meta.get("cell_degrees", ATLAS_CELL_DEGREES))
+        self.azimut_step = float(meta.get("azimut_step", ATLAS_AZIMUT_STEP))
+        self.fingerprint = meta.get("script_fingerprint")
+        self._keys = frozenset(self._connection.execute(
+            "SELECT klimazone, cell_lat, cell_lon, raumhoehe, azimut FROM entries WHERE status = ?", (DONE,)))
+        #Repräsentativer Punkt je (Klimazone, Zelle), an dem die Entwürfe gerechnet wurden
+        #Ältere Atlanten ohne Eintrag in meta liefern ihn über die Einträge selbst
+        if "representative_points" in meta:
+            self.points = {tuple(json.loads(cell)): tuple(point) for cell, point in json.loads(meta["representative_points"]).items()}
+        else:
+            self.points = {(zone, cell_lat, cell_lon): (latitude, longitude) for zone, cell_lat, cell_lon, latitude, longitude in
+                           self._connection.execute("SELECT DISTINCT klimazone, cell_lat, cell_lon, latitude, longitude FROM entries")}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, klimazone, latitude, longitude, raumhoehe, azimut):
+        #Schlüssel des passenden Entwurfs oder None, wenn der Atlas ihn nicht enthält
+        if not klimazone:
+            return None
+        key = atlas_key(klimazone, latitude, longitude, raumhoehe, azimut, self.cell_degrees, self.azimut_step)
+        return key if key is not None and key in self._keys else None
+
+    def _column(self, key, column):
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {column} FROM entries WHERE klimazone = ? AND cell_lat = ? AND cell_lon = ? AND raumhoehe = ? AND azimut = ?",
+                key).fetchone()
+        return None if row is None else row[0]
+
+    def model(self, key, param_name) -> bytes:
+        #Fertige .3dm Datei, param_name wie in der Hops Ausgabe ("Geometry" oder "Floorplan")
+        column = "floorplan" if param_name == "Floorplan" else "geometry"
+        return unpack_blob(self._column(key, column))
+
+    def parameter_data(self, key) -> dict:
+        #parameter_data wie von parse_text_output
+        #Die Wetterdaten im Atlas gehören zum repräsentativen Punkt der Zelle und werden in der App nicht verwendet,
+        #sie kommen immer aus der Analyse am eigenen Standort
+        return json.loads(self._column(key, "parameter_data"))
+
+    def cell_note(self, key) -> str:
+        #Hinweis für die Ansicht: Entwürfe aus dem Atlas sind eine Näherung für die ganze Zelle
+        zone, cell_lat, cell_lon, raumhoehe, azimut = key
+        latitude, longitude = self.points.get((zone, cell_lat, cell_lon), (None, None))
+        cell = (f"Zelle {cell_lat * self.cell_degrees:g}° bis {(cell_lat + 1) * self.cell_degrees:g}° Breite, "
+                f"{cell_lon * self.cell_degrees:g}° bis {(cell_lon + 1) * self.cell_degrees:g}° Länge")
+        point = f", gerechnet bei {latitude:.2f}° / {longitude:.2f}°" if latitude is not None else ""
+        return f"Näherung aus dem Entwurfsatlas für {zone.split()[0]}, {cell}{point}, Raumhöhe {raumhoehe:g} m, Azimut {azimut:g}°"
+
+
+_atlas = None
+_atlas_loaded = False
+_atlas_lock = threading.Lock()
+
+def get_atlas():
+    #Atlas des Prozesses, None wenn keine Datei vorhanden ist oder sie zu einem anderen Skriptstand gehört
+    global _atlas, _atlas_loaded
+    with _atlas_lock:
+        if not _atlas_loaded:
+            _atlas_loaded = True
+            if ATLAS_PATH.exists():
+                try:
+                    atlas = DesignAtlas(ATLAS_PATH)
+                except sqlite3.Error as error:
+                    print(f"Entwurfsatlas {ATLAS_PATH} konnte nicht gelesen werden: {error}")
+                else:
+                    if atlas.fingerprint != script_fingerprint():
+                        print(f"Entwurfsatlas {ATLAS_PATH} gehört zu einem anderen Grasshopper Skript und wird ignoriert")
+                    else:
+                        _atlas = atlas
+                        print(f"Entwurfsatlas mit {len(atlas)} Entwürfen geladen")
+        return _atlas
+
+def _reset_after_fork():
+    #SQLite Verbindungen dürfen nicht in einen geforkten Prozess mitgenommen werden
+    global _atlas, _atlas_loaded, _atlas_lock
+    _atlas = None
+    _atlas_loaded = False
+    _atlas_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,230 @@
+import json
+import threading
+from collections import OrderedDict
+
+from design_atlas import get_atlas
+from geometry_utils import (PREVIEW_THRESHOLD, get_3dm_bytes, get_glb_bytes, get_tree_glb_bytes, get_item_count,
+                            build_glb_bytes, iter_model_objects)
+from gis_functions import get_climate_gdf, find_climate_zone
+from hops_cache import analysis_key, get_disk_cache
+from instrumentation import timer, count
+from hops_params import hops_json, location_key
+from json_utils import HopsResponse, GEOMETRY_PARAM, FLOORPLAN_PARAM, parse_text_output
+
+#Anzahl der Parametersätze, deren Zwischenergebnisse im Speicher gehalten werden
+MAX_PIPELINES = 32
+#Anzahl der Standorte, deren Klimazone und Wetterdaten im Speicher gehalten werden
+MAX_SITES = 64
+
+
+class StagedResults:
+    #Jeder Schritt wird genau einmal ausgeführt, auch wenn mehrere Views gleichzeitig fragen
+
+    def __init__(self):
+        self._results = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name, compute):
+        if name in self._results:
+            return self._results[name]
+        with self._lock:
+            stage_lock = self._locks.setdefault(name, threading.Lock())
+        with stage_lock:
+            if name not in self._results:
+                with timer(f"pipeline.{name}"):
+                    self._results[name] = compute()
+        return self._results[name]
+
+
+class SiteAnalysis(StagedResults):
+    #Alles was nur vom Standort abhängt: Klimazone und Wetterdaten
+    #Wird von allen Entwürfen am selben Standort geteilt, Raumhöhe und Azimut ändern hier nichts
+
+    def __init__(self, latitude, longitude):
+        super().__init__()
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @property
+    def klimazone(self):
+        return self._stage("klimazone", lambda: find_climate_zone(get_climate_gdf(), self.latitude, self.longitude))
+
+    @property
+    def location_key(self) -> str:
+        return self._stage("location_key", lambda: location_key(self.latitude, self.longitude))
+
+    def cached_wetterdaten(self):
+        #Wetterdaten aus einer früheren Analyse an diesem Standort, auch aus anderen Prozessen, sonst None
+        if "wetterdaten" in self._results:
+            return self._results["wetterdaten"]
+        data = get_disk_cache().get(self.location_key)
+        if data is None:
+            return None
+        return self._stage("wetterdaten", lambda: json.loads(data))
+
+    def store_wetterdaten(self, wetterdaten):
+        #Nur Wetterdaten aus einer Hops Analyse genau an diesem Standort speichern
+        if not wetterdaten or self.cached_wetterdaten() is not None:
+            return
+        self._stage("wetterdaten", lambda: wetterdaten)
+        get_disk_cache().set(self.location_key, json.dumps(wetterdaten, ensure_ascii=False).encode("utf-8"))
+
+    def wetterdaten(self, compute):
+        #compute() liefert die Wetterdaten über eine Hops Analyse, falls der Standort noch unbekannt ist
+        wetterdaten = self.cached_wetterdaten()
+        count("pipeline.wetterdaten_hit" if wetterdaten is not None else "pipeline.wetterdaten_miss")
+        return wetterdaten if wetterdaten is not None else compute()
+
+
+class DesignPipeline(StagedResults):
+    #Berechnet alle Schritte eines Entwurfs einmal pro Parametersatz
+    #Hops Ergebnis, .3dm Dateien und Tabellen werden zwischengespeichert,
+    #so dass ein Wechsel zwischen den Views nichts neu berechnet
+    #Klimazone und Wetterdaten kommen aus der SiteAnalysis des Standorts, ein Slider für
+    #Raumhöhe oder Azimut rechnet deswegen nur die Geometrie neu
+
+    def __init__(self, site, raumhoehe, azimut, analysis):
+        super().__init__()
+        self.site = site
+        self.raumhoehe = raumhoehe
+        self.azimut = azimut
+        self._analysis = analysis
+
+    @property
+    def latitude(self):
+        return self.site.latitude
+
+    @property
+    def longitude(self):
+        return self.site.longitude
+
+    @property
+    def klimazone(self):
+        return self.site.klimazone
+
+    @property
+    def formatted_params(self) -> dict:
+        return dict(
+            Raumhöhe=self.raumhoehe,
+            Längengrad=self.longitude,
+            Breitangrad=self.latitude,
+            Klimazone=self.klimazone,
+            AzimutRichtungEingang=self.azimut
+        )
+
+    @property
+    def json_input(self) -> str:
+        #Parameter in ein JSON String damit Hops sie lesen kann
+        return self._stage("json_input", lambda: hops_json(self.formatted_params))
+
+    @property
+    def output(self):
+        #memoized Function aufrufen für GH Skript
+        return self._stage("output", lambda: self._analysis(self.json_input))
+
+    @property
+    def analysis_key(self) -> str:
+        #Schlüssel des Hops Ergebnisses, auch für die abgeleiteten .3dm Dateien
+        return self._stage("analysis_key", lambda: analysis_key(json.loads(self.json_input)))
+
+    @property
+    def atlas_key(self):
+        #Schlüssel des vorberechneten Entwurfs, None wenn der Atlas ihn nicht enthält
+        return self._stage("atlas_key", lambda: get_atlas() and get_atlas().lookup(
+            self.klimazone, self.latitude, self.longitude, self.raumhoehe, self.azimut))
+
+    @property
+    def response(self) -> HopsResponse:
+        #Index der Ausgabeparameter, wird pro Ergebnis nur einmal aufgebaut
+        return self._stage("response", lambda: HopsResponse(self.output))
+
+    def _model(self, param_name, get_inner_tree) -> bytes:
+        #Erst der Atlas, danach wird das Hops Ergebnis nur gelesen, wenn die .3dm noch in keinem Cache liegt
+        if self.atlas_key is not None:
+            return get_atlas().model(self.atlas_key, param_name)
+        return get_3dm_bytes(self.analysis_key, param_name, get_inner_tree)
+
+    def geometry_model(self) -> bytes:
+        return self._stage("geometry_model", lambda: self._model(GEOMETRY_PARAM, lambda: self.response.geometry))
+
+    def floorplan_model(self) -> bytes:
+        return self._stage("floorplan_model", lambda: self._model(FLOORPLAN_PARAM, lambda: self.response.floorplan))
+
+    def _preview(self, param_name, cell_size, get_inner_tree) -> bytes:
+        #GLB Vorschau, aus dem Atlas über dessen .3dm, sonst direkt aus den Items des Hops Ergebnisses
+        if self.atlas_key is not None:
+            return get_glb_bytes(f"atlas:{self.atlas_key}", param_name, cell_size, lambda: build_glb_bytes(
+                iter_model_objects(get_atlas().model(self.atlas_key, param_name)), cell_size))
+        return get_tree_glb_bytes(self.analysis_key, param_name, get_inner_tree, cell_size)
+
+    def geometry_preview(self, cell_size=0.0) -> bytes:
+        return self._stage(f"geometry_preview:{cell_size:g}",
+                           lambda: self._preview(GEOMETRY_PARAM, cell_size, lambda: self.response.geometry))
+
+    def prefers_preview(self) -> bool:
+        #Für den Modus "Automatisch": große Entwürfe als Vorschau, Entwürfe aus dem Atlas liegen schon als .3dm vor
+        #Die Objektanzahl liegt im Cache, sobald ein Modell gebaut wurde, das Hops Ergebnis wird dann nicht gelesen
+        if self.atlas_key is not None:
+            return False
+        items = self._stage("geometry_items", lambda: get_item_count(self.analysis_key, GEOMETRY_PARAM, lambda: self.response.geometry))
+        return items >= PREVIEW_THRESHOLD
+
+    @property
+    def atlas_note(self):
+        #Hinweis für die Ansichten, wenn der Entwurf aus dem Atlas stammt, sonst None
+        return get_atlas().cell_note(self.atlas_key) if self.atlas_key is not None else None
+
+    def _hops_tables(self):
+        parameter_data, wetterdaten = parse_text_output(self.response)
+        self.site.store_wetterdaten(wetterdaten)
+        return parameter_data, wetterdaten
+
+    @property
+    def parameter_data(self) -> dict:
+        #"Parameter_data" aus dem String herauslesen (erste Ausgabe), bei einem Atlastreffer aus dem Atlas
+        if self.atlas_key is not None:
+            return self._stage("atlas_parameter_data", lambda: get_atlas().parameter_data(self.atlas_key))
+        return self._stage("text", self._hops_tables)[0]
+
+    @property
+    def wetterdaten(self) -> dict:
+        #Wetterdaten hängen nur vom Standort ab, nur für einen neuen Standort wird der Text der Analyse gelesen
+        #Auch bei einem Atlastreffer: dessen Wetterdaten gehören zum repräsentativen Punkt der Zelle, nicht zum Standort
+        return self.site.wetterdaten(lambda: self._stage("text", self._hops_tables)[1])
+
+
+_sites = OrderedDict()
+_pipelines = OrderedDict()
+_pipelines_lock = threading.Lock()
+
+def _get_site(latitude, longitude) -> SiteAnalysis:
+    key = (latitude, longitude)
+    site = _sites.get(key)
+    if site is None:
+        site = SiteAnalysis(latitude, longitude)
+        _sites[key] = site
+        if len(_sites) > MAX_SITES:
+            _sites.popitem(last=False)
+    else:
+        _sites.move_to_end(key)
+    return site
+
+def get_pipeline(params, analysis) -> DesignPipeline:
+    #Gibt die Pipeline für den aktuellen Parametersatz zurück, bei Bedarf wird eine neue angelegt
+    key = (
+        params.step_1.point.GeoPointField.lat,
+        params.step_1.point.GeoPointField.lon,
+        params.step_2.geometrie.Raumhöhe,
+        params.step_2.geometrie.AzimutRichtungEingang,
+    )
+    with _pipelines_lock:
+        pipeline = _pipelines.get(key)
+        if pipeline is None:
+            pipeline = DesignPipeline(_get_site(*key[:2]), *key[2:], analysis=analysis)
+            _pipelines[key] = pipeline
+            if len(_pipelines) > MAX_PIPELINES:
+                _pipelines.popitem(last=False)
+        else:
+            _pipelines.move_to_end(key)
+        return pipeline
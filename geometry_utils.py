@@ -0,0 +1,207 @@
+import io
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from viktor import File
+
+from gltf_export import chunked, mesh_chunk, write_glb
+from hops_cache import get_disk_cache
+from instrumentation import instrumented, register_cache, count
+
+
+#Ab dieser Anzahl an Objekten wird die GLB Vorschau in Batches auf mehreren Prozessen vernetzt
+#Standardmäßig aus: auf einem Kern ist der Pool langsamer (600 Objekte: 1.2 s seriell, 1.9 s mit 2 Workern,
+#beim ersten Aufruf 2.7 s durch das Starten der Prozesse), ein Gewinn auf mehreren Kernen ist noch nicht gemessen
+PARALLEL_DECODE_THRESHOLD = 500
+DECODE_BATCH_SIZE = 250
+DECODE_WORKERS = int(os.environ.get("TINYHOUSE_DECODE_WORKERS", 1))
+
+#Ab dieser Anzahl an Objekten zeigt die 3D Ansicht im Modus "Automatisch" die GLB Vorschau
+PREVIEW_THRESHOLD = int(os.environ.get("TINYHOUSE_PREVIEW_THRESHOLD", 2000))
+
+#Obergrenze für fertige .3dm Dateien im Arbeitsspeicher
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("TINYHOUSE_MODEL_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def tree_item_count(inner_tree) -> int:
+    return sum(len(items) for items in inner_tree.values()) if inner_tree else 0
+
+def iter_tree_objects(inner_tree):
+    #Dekodiert die Items eines InnerTrees einzeln, es liegt immer nur ein Objekt im Speicher
+    import rhino3dm
+    for key in inner_tree or {}:
+        for data_item in inner_tree[key]:
+            yield rhino3dm.CommonObject.Decode(json.loads(data_item["data"]))
+
+def iter_model_objects(data: bytes):
+    #Geometrien einer fertigen .3dm, z.B. aus dem Atlas
+    import rhino3dm
+    for obj in rhino3dm.File3dm.FromByteArray(data).Objects:
+        yield obj.Geometry
+
+@instrumented()
+def add_objects_to_model(file3dm, inner_tree):
+    #Hinzufügen der Geometrien aus einem Hops InnerTree zum Viewmodel
+    for obj in iter_tree_objects(inner_tree):
+        file3dm.Objects.Add(obj)
+
+@instrumented()
+def _write_3dm(file3dm) -> bytes:
+    geometry_file = File()
+    file3dm.Write(geometry_file.source, version=7)
+    return geometry_file.getvalue_binary()
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+def _get_decode_pool():
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            #"spawn" statt "fork", da der Webserver Threads hat
+            _decode_pool = ProcessPoolExecutor(DECODE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _decode_pool
+
+def _tree_batches(inner_tree):
+    #Rohdaten der Items in Batches für den Worker-Pool, in der Reihenfolge des InnerTrees
+    return list(chunked((data_item["data"] for key in inner_tree for data_item in inner_tree[key]), DECODE_BATCH_SIZE))
+
+@instrumented()
+def build_3dm_bytes(inner_tree) -> bytes:
+    #Baut aus einem InnerTree eine .3dm Datei (Rhino 7) und gibt deren Inhalt zurück
+    #rhino3dm wird erst beim ersten Modell geladen, Karten- und Tabellenviews brauchen es nicht
+    #Immer seriell: mit einem Worker-Pool kostete das Einlesen und Zusammenführen der Batches im Hauptprozess
+    #schon etwa 3/4 der seriellen Zeit, das .3dm wäre damit auch auf vielen Kernen höchstens etwa 1.3x schneller
+    import rhino3dm
+    file3dm = rhino3dm.File3dm()
+    if not inner_tree:
+        print("Kein InnerTree gefunden.")
+    else:
+        add_objects_to_model(file3dm, inner_tree)
+
+    return _write_3dm(file3dm)
+
+def _mesh_batch(data_strings, cell_size=0.0) -> dict:
+    #Läuft im Worker-Prozess: dekodiert und vernetzt einen Batch für die GLB Vorschau,
+    #zurück kommen nur die kompakten Punkt- und Index-Arrays
+    import rhino3dm
+    return mesh_chunk((rhino3dm.CommonObject.Decode(json.loads(data)) for data in data_strings), cell_size)
+
+def _glb_bytes(chunks) -> bytes:
+    target = io.BytesIO()
+    stats = write_glb(chunks, target)
+    if stats["skipped"]:
+        print(f"{stats['skipped']} Objekte ohne Netz oder Kurve in der Vorschau ausgelassen.")
+    return target.getvalue()
+
+@instrumented()
+def build_glb_bytes(objects, cell_size=0.0) -> bytes:
+    #Kompakte Vorschau als GLB: die Objekte werden als Iterator in Chunks vernetzt und geschrieben,
+    #anders als beim .3dm liegt nie das ganze Modell dekodiert im Speicher
+    #cell_size > 0 vereinfacht die Netze auf ein Raster dieser Weite (in Modelleinheiten)
+    return _glb_bytes(mesh_chunk(chunk, cell_size) for chunk in chunked(objects, DECODE_BATCH_SIZE))
+
+@instrumented()
+def build_glb_bytes_from_tree(inner_tree, cell_size=0.0) -> bytes:
+    #Wie build_glb_bytes, große InnerTrees werden mit TINYHOUSE_DECODE_WORKERS > 1 in Batches auf den Worker-Pool verteilt
+    #Hier läuft fast die ganze Arbeit in den Workern, zurück kommen nur kompakte Arrays
+    if not inner_tree:
+        print("Kein InnerTree gefunden.")
+    if DECODE_WORKERS > 1 and tree_item_count(inner_tree) >= PARALLEL_DECODE_THRESHOLD:
+        batches = _tree_batches(inner_tree)
+        return _glb_bytes(_get_decode_pool().map(_mesh_batch, batches, [cell_size] * len(batches)))
+    return build_glb_bytes(iter_tree_objects(inner_tree), cell_size)
+
+class BytesLRU:
+    #Einfacher LRU Cache für Bytes, begrenzt über die Gesamtgröße
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return data
+
+    def set(self, key, data: bytes):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+_model_cache = BytesLRU(MODEL_CACHE_MAX_BYTES)
+register_cache("geometry_utils.model_cache", lambda: (_model_cache.hits, _model_cache.misses))
+
+def model_cache_key(analysis_key, param_name, model_format="3dm") -> str:
+    return hashlib.sha256(f"{analysis_key}:{model_format}:{param_name}".encode("utf-8")).hexdigest()
+
+def _cached_model(cache_key, build) -> bytes:
+    #Erst Arbeitsspeicher, dann Festplatten-Cache, erst danach wird gebaut
+    data = _model_cache.get(cache_key)
+    if data is None:
+        data = get_disk_cache().get(cache_key)
+        count("geometry_utils.model_disk_hit" if data is not None else "geometry_utils.model_disk_miss")
+        if data is None:
+            data = build()
+            get_disk_cache().set(cache_key, data)
+        _model_cache.set(cache_key, data)
+    return data
+
+def _store_item_count(analysis_key, param_name, inner_tree):
+    count = tree_item_count(inner_tree)
+    get_disk_cache().set(model_cache_key(analysis_key, param_name, "items"), str(count).encode())
+    return count
+
+def get_item_count(analysis_key, param_name, get_inner_tree) -> int:
+    #Anzahl der Objekte eines Ausgabeparameters, liegt als kleiner Eintrag neben den Modellen im Festplatten-Cache
+    #So kann die 3D Ansicht das Format wählen, ohne das Hops Ergebnis zu lesen, wenn das Modell schon im Cache liegt
+    data = get_disk_cache().get(model_cache_key(analysis_key, param_name, "items"))
+    if data is not None:
+        return int(data)
+    return _store_item_count(analysis_key, param_name, get_inner_tree())
+
+def _from_tree(analysis_key, param_name, get_inner_tree, build):
+    #Baut ein Modell aus dem InnerTree und merkt sich dabei dessen Objektanzahl
+    inner_tree = get_inner_tree()
+    _store_item_count(analysis_key, param_name, inner_tree)
+    return build(inner_tree)
+
+@instrumented()
+def get_3dm_bytes(analysis_key, param_name, get_inner_tree) -> bytes:
+    #Fertige .3dm pro (Analyse, Ausgabeparameter), das Hops Ergebnis wird nur ohne Cachetreffer gelesen und dekodiert
+    cache_key = model_cache_key(analysis_key, param_name)
+    return _cached_model(cache_key, lambda: _from_tree(analysis_key, param_name, get_inner_tree, build_3dm_bytes))
+
+@instrumented()
+def get_glb_bytes(analysis_key, param_name, cell_size, build) -> bytes:
+    #GLB Vorschau pro (Analyse, Ausgabeparameter, Vereinfachung), build() baut sie ohne Cachetreffer
+    cache_key = model_cache_key(analysis_key, param_name, f"glb:{cell_size:g}")
+    return _cached_model(cache_key, build)
+
+@instrumented()
+def get_tree_glb_bytes(analysis_key, param_name, get_inner_tree, cell_size=0.0) -> bytes:
+    #Wie get_3dm_bytes für die GLB Vorschau: das Hops Ergebnis wird nur ohne Cachetreffer gelesen
+    return get_glb_bytes(analysis_key, param_name, cell_size, lambda: _from_tree(
+        analysis_key, param_name, get_inner_tree, lambda inner_tree: build_glb_bytes_from_tree(inner_tree, cell_size)))
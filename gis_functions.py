@@ -1,9 +1,20 @@
+import io
+import json
+import hashlib
+import threading
+from functools import lru_cache
 from pathlib import Path
-import geopandas as gpd
-from shapely.geometry import Point
-from geopandas import GeoDataFrame
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+import numpy as np
 from viktor.views import MapLegend, Color
 
+from instrumentation import instrumented
+from climate_store import file_digest, read_climate_store
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+
 
 #Dictionary welches jeder Klimazone eine Farbe zuweist (in Hex)
 climate_colors = {
@@ -39,29 +50,209 @@ climate_colors = {
     'ET Polar-Tundra': '#b2b2b2'
     }
 
-def get_gdf(styling) -> GeoDataFrame:
+CLIMATE_DATA_PATH = Path(__file__).parent / "files/raw-data.json"
+#Dieselben Polygone im binären Spaltenformat, erzeugt mit scripts/build_climate_store.py
+CLIMATE_STORE_DIRECTORY = Path(__file__).parent / "files/koeppen"
+
+#Detailstufen der Kartenansicht mit der Toleranz der Vereinfachung in Grad
+#Die Dateien werden offline mit scripts/build_lod.py erzeugt
+LOD_DIRECTORY = Path(__file__).parent / "files/lod"
+LOD_TIERS = {
+    'Hoch': 0.0,
+    'Mittel': 0.25,
+    'Niedrig': 1.0,
+}
+
+class ClimateDataStore:
+    #Lädt die Köppen-Geiger Geometrien nur einmal pro Prozess
+    #Neu geladen wird nur wenn sich mtime/Größe der Datei und danach auch der Hash geändert haben
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._stamp = None
+        self._digest = None
+        self._gdf = None
+        self._lock = threading.Lock()
+
+    def get(self) -> "GeoDataFrame":
+        stat = self.path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._gdf is None or stamp != self._stamp:
+                data = self.path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                if self._gdf is None or digest != self._digest:
+                    self._gdf = load_climate_gdf(data)
+                    self._digest = digest
+                self._stamp = stamp
+            return self._gdf
+
+    @property
+    def digest(self):
+        #Hash der aktuell geladenen Datei, dient als Schlüssel für abgeleitete Caches
+        self.get()
+        return self._digest
+
+class ColumnarClimateStore:
+    #Wie ClimateDataStore, liest aber das binäre Spaltenformat aus CLIMATE_STORE_DIRECTORY
+    #get() gibt None zurück, wenn es fehlt oder nicht mehr zur GeoJSON Quelle passt
+
+    def __init__(self, directory, source_path=None):
+        self.directory = Path(directory)
+        self.source_path = Path(source_path) if source_path else None
+        self._stamp = None
+        self._digest = None
+        self._gdf = None
+        self._lock = threading.Lock()
+
+    def _current_stamp(self):
+        stamps = []
+        for path in (self.directory / "meta.json", self.source_path):
+            if path is None:
+                continue
+            if not path.exists():
+                return None
+            stat = path.stat()
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamps)
+
+    def get(self):
+        stamp = self._current_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._stamp = stamp
+                self._gdf, self._digest = None, None
+                if stamp is not None:
+                    try:
+                        self._gdf, self._digest = load_columnar_climate_gdf(self.directory, self.source_path)
+                    except (OSError, ValueError) as error:
+                        print(f"Binäre Klimadaten {self.directory} nicht verwendbar: {error}")
+            return self._gdf
+
+    def available(self) -> bool:
+        return self.get() is not None
+
+    @property
+    def digest(self):
+        self.get()
+        return self._digest
+
+def _zone_gdf(geometry, climate, crs) -> "GeoDataFrame":
+    #Basis-GDF: nur Geometrie, Klimazone als Kategorie (int8 Codes)
+    #sowie die Spalten die nur von der Klimazone abhängen
+    from geopandas import GeoDataFrame
+
+    if climate is not None:
+        gdf = GeoDataFrame({'climate': climate}, geometry=geometry, crs=crs)
+        gdf["description"] = ("Klimazone: " + gdf['climate'].astype(str) + "  \n  ").astype("category")
+        gdf['fill'] = gdf['climate'].map(climate_colors)
+    else:
+        gdf = GeoDataFrame(geometry=geometry, crs=crs)
+        gdf["description"] = "Klimazone nicht gefunden  \n  "
+
+    #Räumlichen Index direkt aufbauen, damit er mit dem GDF zwischengespeichert wird
+    gdf.sindex
+    return gdf
+
+@instrumented()
+def load_climate_gdf(data) -> "GeoDataFrame":
+    #Basis-GDF aus GeoJSON
+    #geopandas wird erst hier importiert, Views ohne Karte brauchen es nicht
+    import geopandas as gpd
+
+    gdf = gpd.read_file(io.BytesIO(data))
+    if gdf.crs is None:
+        gdf = gdf.set_crs(4326)
+
+    climate = gdf['climate'].astype("category") if 'climate' in gdf.columns else None
+    return _zone_gdf(gdf.geometry.values, climate, gdf.crs)
+
+@instrumented()
+def load_columnar_climate_gdf(directory, source_path=None):
+    #Basis-GDF aus dem binären Spaltenformat, gibt (gdf, digest) zurück
+    #Der Digest ist der Hash der GeoJSON Quelle, abgeleitete Caches bleiben so beim Formatwechsel gültig
+    import pandas as pd
+
+    geometries, codes, zones, meta = read_climate_store(directory)
+    digest = meta.get("source_sha256")
+    if source_path is not None and source_path.exists() and file_digest(source_path) != digest:
+        raise ValueError(f"veraltet, {source_path.name} wurde seit dem Erzeugen geändert")
+    climate = pd.Categorical.from_codes(codes, categories=zones)
+    return _zone_gdf(geometries, climate, meta["crs"]), digest
+
+_climate_store = ClimateDataStore(CLIMATE_DATA_PATH)
+_columnar_store = ColumnarClimateStore(CLIMATE_STORE_DIRECTORY, CLIMATE_DATA_PATH)
+_lod_stores = {tier: ClimateDataStore(LOD_DIRECTORY / f"koeppen_{tier.lower()}.json") for tier in LOD_TIERS}
+
+@instrumented()
+def lod_path(tier) -> Path:
+    return _lod_stores[tier].path
+
+@instrumented()
+def get_raw_store():
+    #Rohdaten bevorzugt aus dem binären Format, sonst aus dem GeoJSON
+    if _columnar_store.available():
+        return _columnar_store
+    return _climate_store
+
+@instrumented()
+def get_display_store(detail):
+    #Store für die Kartenansicht, ohne vorverarbeitete Datei wird auf die Rohdaten zurückgegriffen
+    store = _lod_stores.get(detail)
+    if store is not None and store.path.exists():
+        return store
+    return get_raw_store()
+
+@instrumented()
+def get_climate_gdf() -> "GeoDataFrame":
+    #Gibt den zwischengespeicherten Basis-GDF zurück, darf nicht verändert werden
+    return get_raw_store().get()
+
+@instrumented()
+def get_gdf(styling) -> "GeoDataFrame":
     # Aus GeoJSON eine Geodataframe bilden der dann angezgit werden kann
     #Unter verwendung von verschidenen Styleparametern
-    gdf = gpd.read_file(Path(__file__).parent / "files/raw-data.json", crs=4326)
-    gdf = gdf.to_crs("EPSG:4326")
-    field_names = gdf.columns.drop(["geometry"])
+    #Die Geometrien kommen aus dem Speicher, pro Anfrage werden nur die Stylespalten gesetzt
+    #Die Detailstufe betrifft nur die Darstellung, Klimazonen werden immer in den Rohdaten gesucht
+    gdf = get_display_store(getattr(styling, "detail", None)).get().copy(deep=False)
     gdf["fill-opacity"] = styling.opacity
     gdf["stroke-width"] = styling.line_width
-
-    gdf_description = ""
-    for field_name in field_names:
-        gdf_description = ""
-        if 'climate' in gdf.columns:
-            gdf_description = "Klimazone: " + gdf['climate'].astype(str) + "  \n  "
-        else:
-            gdf_description = "Klimazone nicht gefunden  \n  "
-    gdf["description"] = gdf_description
-    gdf.fillna("")
-    
-    #Farben aus Dicitionary zu dem gdf hinzufügen
-    gdf['fill'] = gdf['climate'].map(climate_colors)
     return gdf
 
+class GeoJSONPayload:
+    #Einmal serialisierte Features einer Detailstufe, ohne Stylespalten
+    #Deckkraft und Linienbreite werden erst beim Erzeugen der Antwort gesetzt,
+    #so gibt es pro Detailstufe nur eine Kopie im Speicher statt einer pro Stylekombination
+    #GeoJSONAndDataResult erwartet ein Dict, fertige Bytes können deswegen nicht direkt ausgeliefert werden
+
+    def __init__(self, collection, label_point):
+        self.collection = collection
+        self.label_point = label_point
+
+    def with_features(self, styling, *features) -> dict:
+        #Neue Dicts nur für Feature und Properties, Geometrien werden aus dem Cache referenziert
+        style = {"fill-opacity": styling.opacity, "stroke-width": styling.line_width}
+        styled = [{**feature, "properties": {**feature["properties"], **style}} for feature in self.collection["features"]]
+        return {**self.collection, "features": styled + list(features)}
+
+@instrumented()
+def get_geojson_payload(styling) -> GeoJSONPayload:
+    #GeoJSON des Overlays, einmal pro Detailstufe serialisiert
+    #Style und showlegend sind nicht Teil des Schlüssels
+    detail = getattr(styling, "detail", None)
+    digest = get_display_store(detail).digest
+    return _build_geojson_payload(detail, digest)
+
+#Eine Payload pro Detailstufe plus Rohdaten als Rückfall
+@instrumented()
+@lru_cache(maxsize=len(LOD_TIERS) + 1)
+def _build_geojson_payload(detail, digest) -> GeoJSONPayload:
+    gdf = get_display_store(detail).get()
+    collection = json.loads(gdf.to_json())
+    #Für das Label wird nur der Punkt des ersten Polygons benötigt
+    label_point = gdf.geometry.iloc[0].representative_point()
+    return GeoJSONPayload(collection, label_point)
+
 '''
 def get_climate_zones():
     """Methode die alle Einzigartigen Klimazonen auflisted, verwendet um Farb Dictionary zu erstellen"""
@@ -71,6 +262,8 @@ def get_climate_zones():
     return climate_list
 '''
 
+@instrumented()
+@lru_cache(maxsize=1)
 def create_legend():
     #Baut eine Legende basierend auf dem Farb Dictionary
 
@@ -83,15 +276,29 @@ def create_legend():
     legend = MapLegend(legend_items)
     return legend
 
+@instrumented()
 def find_climate_zone(gdf, latitude, longitude):
-    #indet die Klimazone auf basis von Längen und Breitengrad im GDF
-    
-    point = Point(longitude, latitude)
+    #Findet die Klimazone auf basis von Längen und Breitengrad im GDF
+    #Nutzt den räumlichen Index (STRtree) des GDF statt alle Polygone zu durchlaufen
+
+    zones = find_climate_zones(gdf, [latitude], [longitude])
+    return zones[0]
+
+@instrumented()
+def find_climate_zones(gdf, latitudes, longitudes):
+    #Batch-Variante: ordnet beliebig vielen Punkten ihre Klimazone zu
+    #Gibt eine Liste zurück, None für Punkte ausserhalb aller Polygone
+    import geopandas as gpd
+
+    points = gpd.points_from_xy(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+
+    #Der Index wird von geopandas beim ersten Zugriff gebaut und am GDF zwischengespeichert
+    #"within" entspricht Polygon.contains(Punkt), Punkte auf dem Rand zählen also nicht
+    point_idx, polygon_idx = gdf.sindex.query(points, predicate="within")
 
-    selected_zone = None
-    for idx, row in gdf.iterrows():
-        if row['geometry'].contains(point):
-            selected_zone = row['climate']
-            break
+    #Wie bei der linearen Suche gewinnt bei Überlappungen das erste Polygon im GDF
+    first_match = np.full(len(points), len(gdf), dtype=np.int64)
+    np.minimum.at(first_match, point_idx, polygon_idx)
 
-    return selected_zone
\ No newline at end of file
+    climates = gdf['climate'].to_numpy()
+    return [climates[idx] if idx < len(gdf) else None for idx in first_match]
@@ -0,0 +1,385 @@
+import json
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+
+#Kompakte Vorschau als binäres glTF (GLB): nur Dreiecksnetze und Linien, keine Normalen und Texturen
+#rhino3dm kann Breps nicht selbst vernetzen, planare Flächen werden deshalb über ihre Randkurven
+#trianguliert, gekrümmte Flächen über ein Raster auf der ungetrimmten Fläche angenähert
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+JSON_CHUNK = 0x4E4F534A
+BIN_CHUNK = 0x004E4942
+
+FLOAT = 5126
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+MODE_LINES = 1
+MODE_TRIANGLES = 4
+
+#Stützpunkte pro gekrümmter Kante und Rasterweite für gekrümmte Flächen
+CURVE_SEGMENTS = 16
+SURFACE_GRID = 8
+PLANAR_TOLERANCE = 1e-6
+
+#Bis zu dieser Größe bleibt der Binärteil im Arbeitsspeicher, danach wird er in eine temporäre Datei ausgelagert
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+MATERIALS = [
+    {"name": "Flächen", "doubleSided": True,
+     "pbrMetallicRoughness": {"baseColorFactor": [0.8, 0.8, 0.8, 1.0], "metallicFactor": 0.0, "roughnessFactor": 0.9}},
+    {"name": "Linien",
+     "pbrMetallicRoughness": {"baseColorFactor": [0.1, 0.1, 0.1, 1.0], "metallicFactor": 0.0, "roughnessFactor": 1.0}},
+]
+
+EMPTY_TRIANGLES = (np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64))
+EMPTY_SEGMENTS = (np.zeros((0, 3)), np.zeros((0, 2), dtype=np.int64))
+
+
+def _points(points) -> np.ndarray:
+    return np.array([[point.X, point.Y, point.Z] for point in points], dtype=np.float64).reshape(-1, 3)
+
+def curve_points(curve, segments=CURVE_SEGMENTS) -> np.ndarray:
+    #Gerade Kurven über Start und Ende, alle anderen gleichmäßig im Parameterraum abgetastet
+    domain = curve.Domain
+    if curve.IsLinear():
+        parameters = [domain.T0, domain.T1]
+    else:
+        parameters = np.linspace(domain.T0, domain.T1, segments + 1)
+    return _points(curve.PointAt(t) for t in parameters)
+
+def _loop_points(brep, loop, vertices, linear) -> np.ndarray:
+    #Punkte einer Randschleife in Umlaufrichtung, gerade Kanten nur über ihren Startpunkt
+    #linear merkt sich pro Kante, ob sie gerade ist, jede Kante gehört zu zwei Flächen
+    trims = loop.Trims
+    pieces = []
+    for index in range(len(trims)):
+        trim = trims[index]
+        edge_index = trim.EdgeIndex
+        if edge_index not in linear:
+            linear[edge_index] = brep.Edges[edge_index].IsLinear()
+        if linear[edge_index]:
+            pieces.append(vertices[trim.StartVertexIndex][None])
+        else:
+            points = curve_points(brep.Edges[edge_index])
+            pieces.append((points[::-1] if trim.IsReversed else points)[:-1])
+    return np.concatenate(pieces) if pieces else np.zeros((0, 3))
+
+def _cross(a, b):
+    #Kreuzprodukt über die letzte Achse, für kleine Arrays deutlich schneller als np.cross
+    return np.stack((
+        a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1],
+        a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2],
+        a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0],
+    ), axis=-1)
+
+def _newell_normals(polygons):
+    #Normalen nach Newell für ein Array (Flächen, Ecken, 3), die Summe der Kreuzprodukte benachbarter Punkte
+    normals = _cross(polygons, np.roll(polygons, -1, axis=1)).sum(axis=1)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+def _plane_axes(normal):
+    #Zwei orthonormale Achsen in der Ebene zur Normalen
+    helper = np.array([1.0, 0, 0]) if abs(normal[0]) < 0.9 else np.array([0, 1.0, 0])
+    x_axis = np.cross(helper, normal)
+    x_axis /= np.linalg.norm(x_axis)
+    return x_axis, np.cross(normal, x_axis)
+
+def _fan_triangles(polygons):
+    #Planare Flächen ohne Löcher, gleich viele Ecken: konvexe als Fächer, die übrigen über shapely
+    normals = _newell_normals(polygons)
+    edges = np.roll(polygons, -1, axis=1) - polygons
+    turns = np.einsum("fci,fi->fc", _cross(edges, np.roll(edges, -1, axis=1)), normals)
+    convex = (turns >= -PLANAR_TOLERANCE).all(axis=1) & normals.any(axis=1)
+
+    parts = []
+    corners = polygons.shape[1]
+    if convex.any():
+        fan = np.arange(1, corners - 1)
+        fan = np.column_stack((np.zeros_like(fan), fan, fan + 1))
+        count = int(convex.sum())
+        triangles = (fan[None] + corners * np.arange(count)[:, None, None]).reshape(-1, 3)
+        parts.append((polygons[convex].reshape(-1, 3), triangles))
+    for points, normal in zip(polygons[~convex], normals[~convex]):
+        if normal.any():
+            parts.append(_polygon_triangles(points, [], normal))
+    return parts
+
+def _planar_face_triangles(brep, face, vertices, linear):
+    #Gibt die Randpunkte zurück, wenn die Fläche keine Löcher hat, sonst direkt die Dreiecke
+    loops = face.Loops
+    if len(loops) == 1:
+        outer, inner = loops[0], []
+    else:
+        loops = [loops[index] for index in range(len(loops))]
+        outer = next((loop for loop in loops if str(loop.LoopType).endswith("Outer")), None)
+        inner = [loop for loop in loops if str(loop.LoopType).endswith("Inner")]
+    if outer is None:
+        return None, EMPTY_TRIANGLES
+    points = _loop_points(brep, outer, vertices, linear)
+    if len(points) < 3:
+        return None, EMPTY_TRIANGLES
+    if not inner:
+        return points, None
+    normal = _newell_normals(points[None])[0]
+    if not normal.any():
+        return None, EMPTY_TRIANGLES
+    holes = [_loop_points(brep, loop, vertices, linear) for loop in inner]
+    return None, _polygon_triangles(points, holes, normal)
+
+def _polygon_triangles(outer_points, holes, normal):
+    #Nicht konvexe Flächen und Flächen mit Löchern: Constrained Delaunay in der Ebene der Fläche
+    import shapely
+
+    origin = outer_points[0]
+    x_axis, y_axis = _plane_axes(normal)
+
+    def to_plane(points):
+        return np.column_stack(((points - origin) @ x_axis, (points - origin) @ y_axis))
+
+    polygon = shapely.Polygon(to_plane(outer_points), [to_plane(hole) for hole in holes if len(hole) >= 3])
+    if not polygon.is_valid:
+        polygon = shapely.make_valid(polygon)
+    triangles = shapely.get_parts(shapely.constrained_delaunay_triangles(polygon))
+    if len(triangles) == 0:
+        return EMPTY_TRIANGLES
+
+    #Jedes Dreieck als geschlossener Ring mit 4 Punkten, gemeinsame Ecken werden zusammengeführt
+    corners = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3].reshape(-1, 2)
+    unique, inverse = np.unique(corners, axis=0, return_inverse=True)
+    vertices = origin + unique[:, :1] * x_axis + unique[:, 1:] * y_axis
+    return vertices, inverse.reshape(-1, 3)
+
+def _surface_triangles(surface, grid=SURFACE_GRID):
+    #Gekrümmte Fläche als Raster auf der ungetrimmten Fläche, für die Vorschau ausreichend
+    u_domain, v_domain = surface.Domain(0), surface.Domain(1)
+    us = np.linspace(u_domain.T0, u_domain.T1, grid + 1)
+    vs = np.linspace(v_domain.T0, v_domain.T1, grid + 1)
+    vertices = _points(surface.PointAt(u, v) for u in us for v in vs)
+    index = np.arange((grid + 1) ** 2).reshape(grid + 1, grid + 1)
+    a, b, c, d = index[:-1, :-1].ravel(), index[1:, :-1].ravel(), index[1:, 1:].ravel(), index[:-1, 1:].ravel()
+    triangles = np.concatenate([np.column_stack((a, b, c)), np.column_stack((a, c, d))])
+    return vertices, triangles
+
+def brep_triangles(brep):
+    vertices = _points(brep.Vertices[index].Location for index in range(len(brep.Vertices)))
+    parts = []
+    #Randpunkte der planaren Flächen ohne Löcher, nach Anzahl der Ecken gruppiert
+    polygons = {}
+    linear = {}
+    faces = brep.Faces
+    for index in range(len(faces)):
+        face = faces[index]
+        if face.IsPlanar(PLANAR_TOLERANCE):
+            points, triangles = _planar_face_triangles(brep, face, vertices, linear)
+            if points is not None:
+                polygons.setdefault(len(points), []).append(points)
+            else:
+                parts.append(triangles)
+        else:
+            parts.append(_surface_triangles(face.UnderlyingSurface()))
+    for group in polygons.values():
+        parts.extend(_fan_triangles(np.stack(group)))
+    return merge(parts)
+
+def mesh_triangles(mesh):
+    vertices = _points(mesh.Vertices[index] for index in range(len(mesh.Vertices)))
+    faces = np.array([mesh.Faces[index] for index in range(len(mesh.Faces))], dtype=np.int64).reshape(-1, 4)
+    #Viereck (a, b, c, d) wird zu zwei Dreiecken, bei Dreiecken ist c == d
+    quads = faces[faces[:, 2] != faces[:, 3]]
+    triangles = np.concatenate([faces[:, :3], quads[:, [0, 2, 3]]])
+    return vertices, triangles
+
+def object_geometry(geometry):
+    #Gibt (Dreiecke, Liniensegmente) eines rhino3dm Objekts zurück, None für nicht darstellbare Objekte
+    import rhino3dm
+
+    if isinstance(geometry, rhino3dm.Mesh):
+        return mesh_triangles(geometry), EMPTY_SEGMENTS
+    if isinstance(geometry, rhino3dm.Extrusion):
+        mesh = geometry.GetMesh(rhino3dm.MeshType.Any)
+        if mesh is not None:
+            return mesh_triangles(mesh), EMPTY_SEGMENTS
+        geometry = geometry.ToBrep(True)
+    if isinstance(geometry, rhino3dm.Brep):
+        return brep_triangles(geometry), EMPTY_SEGMENTS
+    if isinstance(geometry, rhino3dm.Curve):
+        points = curve_points(geometry)
+        segments = np.column_stack((np.arange(len(points) - 1), np.arange(1, len(points))))
+        return EMPTY_TRIANGLES, (points, segments)
+    return None
+
+
+def merge(parts):
+    #Fasst (Punkte, Indizes) Paare zu einem Paar zusammen
+    parts = [part for part in parts if len(part[1])]
+    if not parts:
+        return EMPTY_TRIANGLES
+    offsets = np.cumsum([0] + [len(vertices) for vertices, _ in parts[:-1]])
+    vertices = np.concatenate([vertices for vertices, _ in parts])
+    indices = np.concatenate([indices + offset for (_, indices), offset in zip(parts, offsets)])
+    return vertices, indices
+
+def decimate(vertices, indices, cell_size):
+    #Vereinfachung über Vertex Clustering: alle Punkte einer Rasterzelle werden zum Zellmittelpunkt,
+    #dabei entartete und doppelte Elemente entfallen. Das Raster ist global, Chunks passen also aneinander
+    if cell_size <= 0 or len(indices) == 0:
+        return vertices, indices
+    cells = np.floor(vertices / cell_size).astype(np.int64)
+    unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+    indices = inverse.reshape(-1)[indices]
+    if indices.shape[1] == 3:
+        keep = (indices[:, 0] != indices[:, 1]) & (indices[:, 1] != indices[:, 2]) & (indices[:, 0] != indices[:, 2])
+    else:
+        keep = indices[:, 0] != indices[:, 1]
+    indices = indices[keep]
+    #Doppelte Elemente unabhängig von Umlaufsinn und Startpunkt
+    _, first = np.unique(np.sort(indices, axis=1), axis=0, return_index=True)
+    indices = indices[np.sort(first)]
+    return (unique + 0.5) * cell_size, indices
+
+
+class GlbWriter:
+    #Schreibt Primitive nacheinander in den Binärteil, erst write() setzt Header und JSON davor
+    #Im Speicher bleiben nur die Beschreibungen der Accessoren, nicht die Geometrie
+
+    def __init__(self, spool_max_bytes=SPOOL_MAX_BYTES):
+        self._binary = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+        self._length = 0
+        self._buffer_views = []
+        self._accessors = []
+        self._meshes = []
+        self.triangles = 0
+        self.segments = 0
+
+    def _append(self, array, target) -> int:
+        data = np.ascontiguousarray(array).tobytes()
+        self._buffer_views.append({"buffer": 0, "byteOffset": self._length, "byteLength": len(data), "target": target})
+        self._binary.write(data)
+        padding = -len(data) % 4
+        self._binary.write(b"\x00" * padding)
+        self._length += len(data) + padding
+        return len(self._buffer_views) - 1
+
+    def _add_primitive(self, vertices, indices, mode, material):
+        if len(indices) == 0:
+            return
+        #Rhino ist Z-oben, glTF Y-oben
+        positions = vertices[:, [0, 2, 1]].astype(np.float32)
+        positions[:, 2] *= -1
+        self._accessors.append({
+            "bufferView": self._append(positions, ARRAY_BUFFER), "componentType": FLOAT,
+            "count": len(positions), "type": "VEC3",
+            "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist(),
+        })
+        index_type = np.uint16 if len(positions) <= np.iinfo(np.uint16).max else np.uint32
+        self._accessors.append({
+            "bufferView": self._append(indices.astype(index_type).ravel(), ELEMENT_ARRAY_BUFFER),
+            "componentType": UNSIGNED_SHORT if index_type is np.uint16 else UNSIGNED_INT,
+            "count": indices.size, "type": "SCALAR",
+        })
+        self._meshes.append({"primitives": [{
+            "attributes": {"POSITION": len(self._accessors) - 2}, "indices": len(self._accessors) - 1,
+            "mode": mode, "material": material,
+        }]})
+
+    def add_triangles(self, vertices, triangles):
+        self._add_primitive(vertices, triangles, MODE_TRIANGLES, 0)
+        self.triangles += len(triangles)
+
+    def add_lines(self, vertices, segments):
+        self._add_primitive(vertices, segments, MODE_LINES, 1)
+        self.segments += len(segments)
+
+    def write(self, target):
+        document = {
+            "asset": {"version": "2.0", "generator": "Tinyhouse-Generator"},
+            "scene": 0,
+            "scenes": [{"nodes": list(range(len(self._meshes)))}],
+            "nodes": [{"mesh": index} for index in range(len(self._meshes))],
+            "meshes": self._meshes,
+            "materials": MATERIALS,
+            "accessors": self._accessors,
+            "bufferViews": self._buffer_views,
+            "buffers": [{"byteLength": self._length}],
+        }
+        if not self._meshes:
+            #Leere Szene ohne Binärteil
+            for key in ("meshes", "accessors", "bufferViews", "buffers"):
+                del document[key]
+        json_data = json.dumps(document, separators=(",", ":")).encode("utf-8")
+        json_data += b" " * (-len(json_data) % 4)
+
+        total = 12 + 8 + len(json_data) + (8 + self._length if self._meshes else 0)
+        target.write(struct.pack("<III", GLB_MAGIC, GLB_VERSION, total))
+        target.write(struct.pack("<II", len(json_data), JSON_CHUNK))
+        target.write(json_data)
+        if self._meshes:
+            target.write(struct.pack("<II", self._length, BIN_CHUNK))
+            self._binary.seek(0)
+            shutil.copyfileobj(self._binary, target)
+        self._binary.close()
+
+
+def mesh_chunk(objects, cell_size=0.0) -> dict:
+    #Vernetzt einen Chunk von rhino3dm Objekten zu je einem Dreiecks- und einem Linienpaar,
+    #cell_size > 0 vereinfacht beide auf ein Raster dieser Weite
+    triangles, segments = [], []
+    skipped = 0
+    for geometry in objects:
+        result = object_geometry(geometry)
+        if result is None:
+            skipped += 1
+            continue
+        triangles.append(result[0])
+        segments.append(result[1])
+    return {
+        "triangles": decimate(*merge(triangles), cell_size),
+        "segments": decimate(*merge(segments), cell_size),
+        "objects": len(triangles),
+        "skipped": skipped,
+    }
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def write_glb(chunks, target) -> dict:
+    #Schreibt die Ergebnisse von mesh_chunk nacheinander als je ein Primitiv,
+    #im Speicher liegt also höchstens ein Chunk an Objekten und Dreiecken
+    writer = GlbWriter()
+    stats = {"objects": 0, "skipped": 0}
+    for chunk in chunks:
+        writer.add_triangles(*chunk["triangles"])
+        writer.add_lines(*chunk["segments"])
+        stats["objects"] += chunk["objects"]
+        stats["skipped"] += chunk["skipped"]
+    writer.write(target)
+    stats["triangles"] = writer.triangles
+    stats["segments"] = writer.segments
+    return stats
+
+def read_glb(data: bytes):
+    #Gibt (JSON, Binärteil) einer GLB Datei zurück, für Tests und Skripte
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    if magic != GLB_MAGIC or version != GLB_VERSION or length != len(data):
+        raise ValueError("Keine gültige GLB Datei")
+    json_length, _ = struct.unpack_from("<II", data, 12)
+    document = json.loads(data[20:20 + json_length])
+    binary = b""
+    if 20 + json_length < len(data):
+        binary_length, _ = struct.unpack_from("<II", data, 20 + json_length)
+        binary = data[28 + json_length:28 + json_length + binary_length]
+    return document, binary
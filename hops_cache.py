@@ -0,0 +1,210 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import importlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+from instrumentation import instrumented, register_cache, timer
+
+try:
+    import fcntl
+except ImportError:
+    #Unter Windows gibt es kein flock, die atomaren Schreibvorgänge reichen dort für konsistente Einträge
+    fcntl = None
+
+
+GRASSHOPPER_SCRIPT_PATH = Path(__file__).parent / "files/Tinyhouse Generator.gh"
+
+#Speicherort und Größe des Caches lassen sich per Umgebungsvariable festlegen
+CACHE_DIR = Path(os.environ.get("TINYHOUSE_CACHE_DIR", Path(tempfile.gettempdir()) / "tinyhouse-hops-cache"))
+CACHE_MAX_BYTES = int(os.environ.get("TINYHOUSE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+#Feste Anzahl an Sperrdateien für key_lock, verschiedene Schlüssel teilen sich selten eine Sperre
+KEY_LOCK_STRIPES = 256
+
+
+def canonical_json(params) -> str:
+    #Eindeutige Darstellung der Parameter: sortierte Keys, keine Leerzeichen
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def script_fingerprint(path=GRASSHOPPER_SCRIPT_PATH) -> str:
+    #Hash des Grasshopper Skripts, wird nur neu berechnet wenn sich die Datei ändert
+    stat = Path(path).stat()
+    return _hash_file(str(path), stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=8)
+def _hash_file(path, mtime_ns, size) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+def analysis_key(formatted_params, script_path=GRASSHOPPER_SCRIPT_PATH) -> str:
+    #Inhaltsadresse eines Ergebnisses: Skript-Hash + kanonische Parameter
+    content = script_fingerprint(script_path) + "\n" + canonical_json(formatted_params)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class HopsDiskCache:
+    #Größenbeschränkter Cache auf der Festplatte, geteilt zwischen allen Prozessen
+    #Einträge werden atomar geschrieben (temporäre Datei + os.replace),
+    #die Reihenfolge für das Verdrängen (LRU) ergibt sich aus der mtime der Einträge
+
+    suffix = ".bin"
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        #Zugriff vermerken, damit häufig genutzte Einträge nicht verdrängt werden
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def set(self, key, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def evict(self):
+        #Älteste Einträge löschen bis der Cache wieder unter der Grenze liegt
+        with self._lock():
+            entries = []
+            for path in self.directory.glob(f"*{self.suffix}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+    def _lock(self):
+        return self._file_lock(self.directory / ".lock")
+
+    def key_lock(self, key):
+        #Sperre pro Eintrag, damit mehrere Prozesse denselben Eintrag nicht gleichzeitig berechnen
+        #Die Schlüssel werden auf KEY_LOCK_STRIPES Dateien verteilt, eine Datei pro Schlüssel würde nie gelöscht
+        #und das Löschen einer Sperrdatei während jemand wartet hebt die Sperre auf
+        lock_directory = self.directory / "locks"
+        lock_directory.mkdir(exist_ok=True)
+        stripe = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) % KEY_LOCK_STRIPES
+        return self._file_lock(lock_directory / f"stripe-{stripe:03d}.lock")
+
+    @contextmanager
+    def _file_lock(self, path):
+        if fcntl is None:
+            yield
+            return
+        with open(path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_hops_analysis(formatted_params):
+    #Standard-Runner: führt das Grasshopper Skript über Hops/Rhino.Compute aus
+    from viktor import File
+    from viktor.external.grasshopper import GrasshopperAnalysis
+
+    script = File.from_path(GRASSHOPPER_SCRIPT_PATH)
+    analysis = GrasshopperAnalysis(script=script, input_parameters=formatted_params)
+    #Analyse wird durchgeführt, sollte sie läger als 240 Sekunden dauern, wird sie angebrochen
+    analysis.execute(timeout=240)
+    return analysis.get_output()
+
+_hops_runner = None
+_disk_cache = None
+
+#Zähler für Treffer im Festplatten-Cache und tatsächliche Hops Läufe
+cache_stats = {"hits": 0, "misses": 0, "runs": 0, "run_seconds": 0.0}
+register_cache("hops_cache.disk", lambda: (cache_stats["hits"], cache_stats["misses"]))
+#cached_analysis läuft in den Threads des Schedulers, += auf dem Dict ist dort nicht atomar
+_stats_lock = threading.Lock()
+
+def _count_stats(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            cache_stats[name] += value
+
+def set_hops_runner(runner):
+    #Ersetzt den Runner, z.B. durch einen lokalen Stub für Tests ohne Rhino.Compute
+    #None stellt den Standard wieder her
+    global _hops_runner
+    _hops_runner = runner
+
+def get_hops_runner():
+    if _hops_runner is not None:
+        return _hops_runner
+    #Alternativ per Umgebungsvariable im Format "modul:funktion"
+    runner_path = os.environ.get("TINYHOUSE_HOPS_RUNNER")
+    if runner_path:
+        module_name, function_name = runner_path.split(":", 1)
+        return getattr(importlib.import_module(module_name), function_name)
+    return run_hops_analysis
+
+def get_disk_cache() -> HopsDiskCache:
+    global _disk_cache
+    if _disk_cache is None:
+        _disk_cache = HopsDiskCache()
+    return _disk_cache
+
+@instrumented()
+def cached_analysis(formatted_params, runner=None, cache=None):
+    #Ergebnis aus dem Festplatten-Cache oder, falls nicht vorhanden, über den Runner berechnen
+    cache = cache if cache is not None else get_disk_cache()
+    key = analysis_key(formatted_params)
+
+    data = cache.get(key)
+    if data is not None:
+        try:
+            output = json.loads(gzip.decompress(data))
+            _count_stats(hits=1)
+            return output
+        except (OSError, ValueError):
+            print(f"Beschädigter Cache-Eintrag {key} wird verworfen")
+            cache.delete(key)
+
+    _count_stats(misses=1)
+    runner = runner if runner is not None else get_hops_runner()
+    start = time.perf_counter()
+    with timer("hops_cache.round_trip"):
+        output = runner(formatted_params)
+    duration = time.perf_counter() - start
+    _count_stats(runs=1, run_seconds=duration)
+    print(f"Grasshopper Analyse in {duration:.1f} s berechnet")
+
+    cache.set(key, gzip.compress(json.dumps(output).encode("utf-8"), compresslevel=5))
+    return output
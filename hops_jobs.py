@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from hops_cache import analysis_key, cached_analysis, cache_stats, get_disk_cache
+
+
+#Maximale Anzahl gleichzeitiger Hops Läufe pro Prozess, sollte zur Größe der Rhino.Compute Flotte passen
+HOPS_WORKERS = int(os.environ.get("TINYHOUSE_HOPS_WORKERS", 2))
+#Eigener, kleinerer Pool für den Standortvergleich, damit eine große CSV die Views in Step 2/3 nicht blockiert
+BATCH_HOPS_WORKERS = int(os.environ.get("TINYHOUSE_BATCH_HOPS_WORKERS", 1))
+#Anzahl abgeschlossener Jobs, deren Status noch abgefragt werden kann
+#Das Ergebnis selbst behält ein Job nur bis zur Übergabe, danach liegt es im Festplatten-Cache
+MAX_FINISHED_JOBS = 64
+#Annahme für die Fortschrittsanzeige solange noch keine Laufzeit gemessen wurde
+DEFAULT_EXPECTED_SECONDS = 60.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class HopsJob:
+    #Ein Hops Lauf für einen Parametersatz, die Job-ID ist der Analyse-Schlüssel
+
+    def __init__(self, key, formatted_params):
+        self.key = key
+        self.formatted_params = formatted_params
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.done_event = threading.Event()
+        self._waiters = 0
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    @property
+    def progress(self) -> float:
+        #Hops meldet keinen Fortschritt, deswegen Schätzung über die bisher gemessene Laufzeit
+        if self.finished:
+            return 1.0
+        started_at = self.started_at
+        if self.status == QUEUED or started_at is None:
+            return 0.0
+        runs = cache_stats["runs"]
+        expected = cache_stats["run_seconds"] / runs if runs else DEFAULT_EXPECTED_SECONDS
+        return min(0.95, (time.time() - started_at) / max(expected, 1e-6))
+
+    def get_result(self, timeout=None):
+        #Wartet auf das Ergebnis, Fehler der Analyse werden weitergereicht
+        with self._lock:
+            self._waiters += 1
+        try:
+            finished = self.done_event.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters -= 1
+                result = self.result
+                self.release_result()
+        if not finished:
+            raise TimeoutError(f"Job {self.key} ist nach {timeout} s noch nicht fertig")
+        if self.error is not None:
+            raise self.error
+        if result is None:
+            #Wer erst nach der Übergabe fragt, bekommt das Ergebnis aus dem Festplatten-Cache
+            with get_disk_cache().key_lock(self.key):
+                result = cached_analysis(self.formatted_params)
+        return result
+
+    def release_result(self):
+        #Nur unter self._lock aufrufen: sobald alle Wartenden das Ergebnis haben, wird es nicht mehr gehalten,
+        #memoize, Pipelines und Festplatten-Cache halten es ohnehin
+        if self.finished and not self._waiters:
+            self.result = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.key,
+            "status": self.status,
+            "progress": self.progress,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": None if self.error is None else str(self.error),
+        }
+
+
+class HopsJobScheduler:
+    #Begrenzter Worker-Pool für Hops Analysen
+    #Gleichzeitige Anfragen mit demselben Schlüssel werden zu einem Job zusammengefasst,
+    #über Prozesse hinweg sorgt eine Dateisperre pro Schlüssel dafür, dass nur einer rechnet
+
+    def __init__(self, max_workers=HOPS_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="hops")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, formatted_params) -> str:
+        #Nicht blockierend, gibt die Job-ID zurück
+        return self.submit_job(formatted_params).key
+
+    def submit_job(self, formatted_params) -> HopsJob:
+        #Wie submit, gibt aber den Job selbst zurück
+        #Abgeschlossene Jobs werden nach MAX_FINISHED_JOBS vergessen, wer viele Jobs auf einmal
+        #einreicht, hält deswegen die Jobs und fragt nicht später über die ID nach
+        key = analysis_key(formatted_params)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != FAILED:
+                self._jobs.move_to_end(key)
+                return job
+            job = HopsJob(key, formatted_params)
+            self._jobs[key] = job
+            #Das Future erlaubt z.B. concurrent.futures.as_completed über mehrere Jobs
+            job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        #Erst die Startzeit, dann der Status: poll() aus einem anderen Thread rechnet mit started_at sobald RUNNING gilt
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            with get_disk_cache().key_lock(job.key):
+                job.result = cached_analysis(job.formatted_params)
+            job.status = DONE
+        except Exception as error:
+            job.error = error
+            job.status = FAILED
+            print(f"Grasshopper Analyse {job.key} fehlgeschlagen: {error}")
+        finally:
+            job.finished_at = time.time()
+            job.done_event.set()
+            with job._lock:
+                job.release_result()
+            self._forget_finished()
+
+    def _forget_finished(self):
+        with self._lock:
+            finished = [key for key, job in self._jobs.items() if job.finished]
+            for key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[key]
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def poll(self, job_id):
+        #Status eines Jobs als Dict, None wenn die ID unbekannt ist
+        job = self.get_job(job_id)
+        return None if job is None else job.to_dict()
+
+    def result(self, job_id, timeout=None):
+        #Wartet auf das Ergebnis, Fehler der Analyse werden weitergereicht
+        job = self.get_job(job_id)
+        if job is None:
+            raise KeyError(f"Unbekannter Job {job_id}")
+        return job.get_result(timeout)
+
+    def run(self, formatted_params, timeout=None):
+        #Blockierende Variante: einreichen und auf das Ergebnis warten
+        return self.result(self.submit(formatted_params), timeout)
+
+
+_scheduler = None
+_batch_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> HopsJobScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = HopsJobScheduler()
+        return _scheduler
+
+def get_batch_scheduler() -> HopsJobScheduler:
+    #Scheduler für Stapelauswertungen, dieselbe Analyse in beiden Pools rechnet wegen der Sperre pro Schlüssel nur einmal
+    global _batch_scheduler
+    with _scheduler_lock:
+        if _batch_scheduler is None:
+            _batch_scheduler = HopsJobScheduler(BATCH_HOPS_WORKERS)
+        return _batch_scheduler
+
+def _reset_after_fork():
+    #Ein geforkter Prozess erbt die Scheduler, aber nicht deren Worker-Threads
+    global _scheduler, _batch_scheduler, _scheduler_lock
+    _scheduler = None
+    _batch_scheduler = None
+    _scheduler_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+from hops_cache import analysis_key, canonical_json, cache_stats
+from instrumentation import register_cache
+
+
+#Genauigkeit mit der das Grasshopper Skript die Eingaben tatsächlich verwendet
+#Koordinaten: 0.01° (~1 km), die Klimazonen liegen auf einem 0.1° Raster
+COORDINATE_DECIMALS = 2
+#Raumhöhe: Schrittweite des Sliders (0.1 m)
+RAUMHOEHE_DECIMALS = 1
+#Azimut: ganze Grad, 360° entspricht 0°
+AZIMUTH_STEP = 1
+
+
+def normalize_hops_params(formatted_params) -> dict:
+    #Rundet die Eingaben auf die vom Skript genutzte Genauigkeit
+    #Punkte wenige Meter auseinander ergeben so denselben Schlüssel
+    normalized = dict(formatted_params)
+    if normalized.get("Breitangrad") is not None:
+        normalized["Breitangrad"] = round(float(normalized["Breitangrad"]), COORDINATE_DECIMALS)
+    if normalized.get("Längengrad") is not None:
+        normalized["Längengrad"] = round(float(normalized["Längengrad"]), COORDINATE_DECIMALS)
+    if normalized.get("Raumhöhe") is not None:
+        normalized["Raumhöhe"] = round(float(normalized["Raumhöhe"]), RAUMHOEHE_DECIMALS)
+    if normalized.get("AzimutRichtungEingang") is not None:
+        #Ganzzahlig lassen: AzimutRichtungEingang ist im Skript ein "Get String", 90.0 käme dort als "90.0" an
+        azimut = int(round(float(normalized["AzimutRichtungEingang"]) / AZIMUTH_STEP)) * AZIMUTH_STEP
+        normalized["AzimutRichtungEingang"] = azimut % 360
+    return normalized
+
+def location_key(latitude, longitude) -> str:
+    #Schlüssel für Ergebnisse, die nur vom Standort abhängen (z.B. Wetterdaten), gleiche Rundung wie für Hops
+    location = normalize_hops_params(dict(Breitangrad=latitude, Längengrad=longitude))
+    return analysis_key(dict(location, Stufe="Standort"))
+
+def hops_json(formatted_params) -> str:
+    #Normalisierte Parameter als kanonischer JSON String, dient als Schlüssel für memoize
+    normalized = normalize_hops_params(formatted_params)
+    key = canonical_json(normalized)
+    key_stats.record(canonical_json(formatted_params), key)
+    return key
+
+
+class KeyStatistics:
+    #Zählt wie oft ein Schlüssel schon einmal angefragt wurde
+    #"quantized_hits" sind Treffer, die es ohne die Rundung nicht gegeben hätte
+
+    def __init__(self, max_keys=4096):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._raw_keys = OrderedDict()
+        self._keys = OrderedDict()
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.quantized_hits = 0
+
+    def _remember(self, seen, key) -> bool:
+        known = key in seen
+        seen[key] = None
+        seen.move_to_end(key)
+        if len(seen) > self.max_keys:
+            seen.popitem(last=False)
+        return known
+
+    def record(self, raw_key, key):
+        with self._lock:
+            self.requests += 1
+            raw_known = self._remember(self._raw_keys, raw_key)
+            if self._remember(self._keys, key):
+                self.hits += 1
+                if not raw_known:
+                    self.quantized_hits += 1
+            else:
+                self.misses += 1
+
+    def report(self) -> dict:
+        with self._lock:
+            report = {
+                "requests": self.requests,
+                "hits": self.hits,
+                "misses": self.misses,
+                "quantized_hits": self.quantized_hits,
+                "hit_rate": self.hits / self.requests if self.requests else 0.0,
+            }
+        #Laufzeiten aus dem Festplatten-Cache, daraus lässt sich die gesparte Rechenzeit abschätzen
+        runs = cache_stats["runs"]
+        average_run = cache_stats["run_seconds"] / runs if runs else 0.0
+        report.update({
+            "disk_hits": cache_stats["hits"],
+            "disk_misses": cache_stats["misses"],
+            "hops_runs": runs,
+            "hops_seconds": cache_stats["run_seconds"],
+            "saved_seconds_estimate": (report["hits"] + cache_stats["hits"]) * average_run,
+        })
+        return report
+
+key_stats = KeyStatistics()
+register_cache("hops_params.keys", lambda: (key_stats.hits, key_stats.misses))
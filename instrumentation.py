@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import tempfile
+import functools
+import threading
+from contextlib import nullcontext, contextmanager
+
+
+#Messung der Laufzeiten, Cache-Treffer und Datenmengen, standardmäßig aus
+#TINYHOUSE_METRICS=1 sammelt nur, =log schreibt zusätzlich jede Messung als JSON-Zeile
+#TINYHOUSE_METRICS_FILE schreibt nach jeder View einen Prometheus Textexport (z.B. für den node_exporter textfile collector)
+METRICS_MODE = os.environ.get("TINYHOUSE_METRICS", "").strip().lower()
+METRICS_ENABLED = METRICS_MODE not in ("", "0", "false", "off")
+METRICS_LOG = METRICS_MODE == "log"
+METRICS_FILE = os.environ.get("TINYHOUSE_METRICS_FILE")
+
+PREFIX = "tinyhouse"
+
+
+class Metrics:
+    #Summen pro Messpunkt: Anzahl, Gesamtzeit, Maximum sowie Bytes pro Nutzlast
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.timers = {}
+        self.sizes = {}
+        self.counters = {}
+
+    def observe_time(self, name, seconds):
+        with self._lock:
+            entry = self.timers.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+        if METRICS_LOG:
+            print(json.dumps({"metric": name, "seconds": round(seconds, 6)}))
+
+    def observe_size(self, name, nbytes):
+        with self._lock:
+            entry = self.sizes.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += nbytes
+            entry[2] = nbytes
+        if METRICS_LOG:
+            print(json.dumps({"metric": name, "bytes": nbytes}))
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+metrics = Metrics()
+
+#Quellen für Treffer/Fehlversuche, die erst beim Export abgefragt werden und zur Laufzeit nichts kosten
+_cache_sources = {}
+
+def register_cache(name, get_counts):
+    #get_counts() -> (hits, misses)
+    _cache_sources[name] = get_counts
+
+
+def instrumented(name=None):
+    #Decorator für Laufzeitmessung, ohne aktivierte Messung wird die Funktion unverändert zurückgegeben
+    def decorate(function):
+        metric = name or f"{function.__module__}.{function.__qualname__}"
+        if hasattr(function, "cache_info"):
+            register_cache(metric, lambda: function.cache_info()[:2])
+        if not METRICS_ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.observe_time(metric, time.perf_counter() - start)
+
+        #lru_cache Funktionen behalten cache_info/cache_clear
+        for attribute in ("cache_info", "cache_clear"):
+            if hasattr(function, attribute):
+                setattr(wrapper, attribute, getattr(function, attribute))
+        return wrapper
+    return decorate
+
+@contextmanager
+def _timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_time(name, time.perf_counter() - start)
+
+_null_timer = nullcontext()
+
+def timer(name):
+    #with timer("stufe"): ... misst einen Abschnitt innerhalb einer Funktion
+    return _timer(name) if METRICS_ENABLED else _null_timer
+
+def count(name, value=1):
+    if METRICS_ENABLED:
+        metrics.increment(name, value)
+
+def payload_size(name, payload):
+    #Größe einer Nutzlast in Bytes, andere Objekte werden dafür als JSON serialisiert
+    if not METRICS_ENABLED:
+        return
+    if not isinstance(payload, (bytes, bytearray)):
+        payload = json.dumps(payload, default=str).encode("utf-8")
+    metrics.observe_size(name, len(payload))
+
+
+def view_instrumented(function):
+    #Für die Controller Views: Laufzeit messen und danach ggf. den Textexport aktualisieren
+    if not METRICS_ENABLED:
+        return function
+    timed = instrumented(f"view.{function.__name__}")(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return timed(*args, **kwargs)
+        finally:
+            if METRICS_FILE:
+                write_metrics(METRICS_FILE)
+    return wrapper
+
+
+def snapshot() -> dict:
+    #Aktueller Stand als Dict, z.B. für strukturierte Logs
+    with metrics._lock:
+        timers = {name: {"count": c, "seconds": s, "max_seconds": m} for name, (c, s, m) in metrics.timers.items()}
+        sizes = {name: {"count": c, "bytes": b, "last_bytes": last} for name, (c, b, last) in metrics.sizes.items()}
+        counters = dict(metrics.counters)
+    caches = {}
+    for name, get_counts in list(_cache_sources.items()):
+        hits, misses = get_counts()
+        caches[name] = {"hits": hits, "misses": misses}
+    return {"timers": timers, "sizes": sizes, "counters": counters, "caches": caches}
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus_text() -> str:
+    #Prometheus Textformat aller Messungen
+    data = snapshot()
+    lines = [
+        f"# HELP {PREFIX}_stage_seconds Laufzeit pro Messpunkt",
+        f"# TYPE {PREFIX}_stage_seconds summary",
+    ]
+    for name, entry in sorted(data["timers"].items()):
+        lines.append(f'{PREFIX}_stage_seconds_count{{stage="{_label(name)}"}} {entry["count"]}')
+        lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{_label(name)}"}} {entry["seconds"]:.6f}')
+    lines.append(f"# TYPE {PREFIX}_stage_seconds_max gauge")
+    for name, entry in sorted(data["timers"].items()):
+        lines.append(f'{PREFIX}_stage_seconds_max{{stage="{_label(name)}"}} {entry["max_seconds"]:.6f}')
+
+    lines.append(f"# HELP {PREFIX}_payload_bytes Größe der gelieferten Daten")
+    lines.append(f"# TYPE {PREFIX}_payload_bytes summary")
+    for name, entry in sorted(data["sizes"].items()):
+        lines.append(f'{PREFIX}_payload_bytes_count{{payload="{_label(name)}"}} {entry["count"]}')
+        lines.append(f'{PREFIX}_payload_bytes_sum{{payload="{_label(name)}"}} {entry["bytes"]}')
+
+    lines.append(f"# TYPE {PREFIX}_cache_hits_total counter")
+    for name, entry in sorted(data["caches"].items()):
+        lines.append(f'{PREFIX}_cache_hits_total{{cache="{_label(name)}"}} {entry["hits"]}')
+    lines.append(f"# TYPE {PREFIX}_cache_misses_total counter")
+    for name, entry in sorted(data["caches"].items()):
+        lines.append(f'{PREFIX}_cache_misses_total{{cache="{_label(name)}"}} {entry["misses"]}')
+
+    lines.append(f"# TYPE {PREFIX}_events_total counter")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f'{PREFIX}_events_total{{event="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path):
+    #Atomar schreiben, damit ein Collector nie eine halbe Datei liest
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(prometheus_text())
+    os.replace(temp_path, path)
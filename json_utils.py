@@ -1,5 +1,12 @@
+import re
 import json
+import math
+from functools import lru_cache
+from typing import NamedTuple
 
+from instrumentation import instrumented
+
+@instrumented()
 def read_json_file(file_path):
     #Liest die JSON-Datei ein und gibt die 'text_lines' zurück
 
@@ -8,54 +15,198 @@ def read_json_file(file_path):
     return data.get("text_lines", [])
 
 
+MONATE = ("Januar", "Februar", "März", "April", "Mai", "Juni", "Juli", "August", "September", "Oktober", "November", "Dezember")
+#Schlüsselwort im Text -> Spalte der Wettertabelle
+WETTER_METRIKEN = {"Schneefall": "Schneefall [mm]", "Niederschlag": "Niederschlag [mm]"}
+
+_MONAT_SET = frozenset(MONATE)
+_MONAT_RE = re.compile("|".join(MONATE))
+
+
+class ParameterRecord(NamedTuple):
+    name: str
+    value: str
+    begründung: str
+
+
+class WeatherTable:
+    #Wetterdaten als Monat x Metrik Array, fehlende Werte sind NaN
+
+    def __init__(self, months, metrics, values):
+        self.months = months
+        self.metrics = metrics
+        self.values = values
+
+    def get(self, monat, metrik, default=None):
+        row = self.values[self.months.index(monat)]
+        value = row[self.metrics.index(metrik)]
+        return default if math.isnan(value) else value
+
+    def to_dict(self) -> dict:
+        #Format des bisherigen Parsers: {monat: {metrik: wert}}
+        return {
+            monat: {metrik: value for metrik, value in zip(self.metrics, row) if not math.isnan(value)}
+            for monat, row in zip(self.months, self.values)
+        }
+
+
+class TxResult(NamedTuple):
+    parameters: dict
+    weather: WeatherTable
+
+    def as_dicts(self):
+        #(parameter_data, wetterdaten) wie von parse_data_string
+        parameter_data = {record.name: {"value": record.value, "begründung": record.begründung} for record in self.parameters.values()}
+        return parameter_data, self.weather.to_dict()
+
+
+def _lines(source):
+    #Akzeptiert einen kompletten Text, eine Liste von Zeilen oder einen Stream (z.B. geöffnete Datei)
+    if isinstance(source, bytes):
+        source = source.decode("utf-8")
+    if isinstance(source, str):
+        #Zeilenumbrüche im Hops Text kommen als escapte "\\r\\n" vor
+        return source.replace("\\r\\n", "\n").splitlines()
+    return _iter_stream_lines(source)
+
+def _iter_stream_lines(source):
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if "\\r\\n" in line:
+            yield from line.replace("\\r\\n", "\n").splitlines()
+        else:
+            yield line
+
+@instrumented()
+def parse_tx(source) -> TxResult:
+    #Liest den "Tx" Text aus Grasshopper in einem Durchlauf
+    #Zeilen "Name = Wert weil Begründung" werden zu Parametern,
+    #Zeilen mit einem Monat im Namen (z.B. "Niederschlag Januar = 12.5") zu Wetterdaten
+    parameters = {}
+    metrics = tuple(WETTER_METRIKEN.values())
+    months = []
+    month_rows = {}
+    nan_row = [math.nan] * len(metrics)
+
+    for line in _lines(source):
+        key, separator, value = line.strip().strip('"').partition(' = ')
+        if not separator:
+            continue
+
+        #Schneller Weg: der Monat steht als zweites Wort im Namen, sonst irgendwo im Namen suchen
+        tokens = key.split()
+        if not (len(tokens) > 1 and tokens[1] in _MONAT_SET) and _MONAT_RE.search(key) is None:
+            # Wenn "weil" enthalten ist -> Begründung extrahieren
+            value, _, begründung = value.partition("weil")
+            name = key.strip()
+            parameters[name] = ParameterRecord(name, value.strip(), begründung.strip())
+            continue
+
+        # Füge Wetterdaten in die korrekte Zeile der Wettertabelle ein
+        monat = tokens[1]
+        row = month_rows.get(monat)
+        if row is None:
+            row = month_rows[monat] = list(nan_row)
+            months.append(monat)
+        for index, keyword in enumerate(WETTER_METRIKEN):
+            if keyword in key:
+                row[index] = float(value.partition("weil")[0])
+                break
+
+    return TxResult(parameters, WeatherTable(months, metrics, [month_rows[monat] for monat in months]))
+
+@instrumented()
 def parse_data_string(text_lines):
     #Funktion zum Parsen der Daten aus dem übergebenen String
-    lines = text_lines
-    parameter_data = {}
-    wetterdaten = {}
-
-    for line in lines:
-        line = line.strip().strip('"')
-        if ' = ' in line:
-            key, value = line.split(' = ', 1)
-            # Wenn "weil" enthalten ist -> Begründung extrahieren
-            if "weil" in value:
-                value, begründung = value.split("weil", 1)
-                begründung = begründung.strip()
-            else:
-                begründung = ""
-            
-            # Füge Wetterdaten in die korrekte Wetterdatentabelle ein
-            if any(monat in key for monat in ["Januar", "Februar", "März", "April", "Mai", "Juni", "Juli", "August", "September", "Oktober", "November", "Dezember"]):
-                monat = key.split()[1]  # Monat herauslesen
-                if monat not in wetterdaten:
-                    wetterdaten[monat] = {}
-                if "Schneefall" in key:
-                    wetterdaten[monat]["Schneefall [mm]"] = float(value)
-                elif "Niederschlag" in key:
-                    wetterdaten[monat]["Niederschlag [mm]"] = float(value)
-            else:
-                parameter_data[key.strip()] = {"value": value.strip(), "begründung": begründung}
-
-    return parameter_data, wetterdaten
+    #Gibt (parameter_data, wetterdaten) als Dicts zurück, siehe parse_tx für die typisierte Variante
+    return parse_tx(text_lines).as_dicts()
 
+@instrumented()
 def get_inner_tree_by_param_name(output, param_name):
-
     #Hilfsfunktion, um basierend auf ParamName das entsprechende InnerTree zu erhalten.
-    # Prüfen, ob output eine Liste oder ein Dictionary ist
-    
-    if isinstance(output, list):
-        print(f"Warning: Output is a list, expected a dictionary. Output: {output}")
-        # Gehe davon aus, dass jedes Element der Liste ein Dictionary ist und versuche, "ParamName" zu finden
-        for item in output:
-            if isinstance(item, dict) and item.get("ParamName") == param_name:
-                return item.get("InnerTree")
-    elif isinstance(output, dict) and "values" in output:
-        for item in output["values"]:
-            if "ParamName" in item and item["ParamName"] == param_name:
-                return item["InnerTree"]
-    else:
-        print(f"Unexpected output structure: {output}")
-
-    print(f"Kein InnerTree gefunden für {param_name}")
-    return None  # Falls das ParamName nicht gefunden wird
\ No newline at end of file
+    #Für mehrere Zugriffe auf dasselbe Ergebnis besser einmal HopsResponse(output) erstellen
+    return hops_response(output).tree(param_name)
+
+#Namen der Ausgabeparameter im Grasshopper Skript (NickName der Context Bake/Print Komponenten)
+GEOMETRY_PARAM = "Geometry"
+FLOORPLAN_PARAM = "Floorplan"
+TEXT_PARAM = "Tx"
+#Position des Grundrisses in älteren Ergebnissen, nur noch als Rückfall
+FLOORPLAN_INDEX = 2
+
+
+class HopsResponse:
+    #Hops Ergebnis mit einem Index ParamName -> InnerTree, der einmal beim Erstellen aufgebaut wird
+    #Die Items werden hier nicht dekodiert, das machen die Modell-Builder beim Aufbau (iter_tree_objects),
+    #deren Ergebnis wird als fertiges Modell zwischengespeichert
+
+    @instrumented()
+    def __init__(self, output):
+        self.output = output
+        self._values = []
+        if isinstance(output, list):
+            self._values = output
+        elif isinstance(output, dict) and "values" in output:
+            self._values = output["values"]
+        else:
+            print(f"Unexpected output structure: {output}")
+
+        self._trees = {}
+        for item in self._values:
+            if isinstance(item, dict) and "ParamName" in item:
+                #Wie bei der linearen Suche gewinnt der erste Eintrag mit diesem Namen
+                self._trees.setdefault(item["ParamName"], item.get("InnerTree"))
+
+    def __contains__(self, param_name) -> bool:
+        return param_name in self._trees
+
+    def tree(self, param_name):
+        #InnerTree eines Ausgabeparameters, None wenn es ihn nicht gibt
+        if param_name not in self._trees:
+            print(f"Kein InnerTree gefunden für {param_name}")
+        return self._trees.get(param_name)
+
+    @property
+    def geometry(self):
+        return self.tree(GEOMETRY_PARAM)
+
+    @property
+    def floorplan(self):
+        if FLOORPLAN_PARAM in self._trees:
+            return self._trees[FLOORPLAN_PARAM]
+        #Ältere Skriptstände ohne eindeutigen Namen: bisherige feste Position, aber nicht mehr stillschweigend
+        if len(self._values) > FLOORPLAN_INDEX and isinstance(self._values[FLOORPLAN_INDEX], dict):
+            print(f"Warning: Kein Ausgabeparameter {FLOORPLAN_PARAM}, verwende Ausgabe {FLOORPLAN_INDEX}")
+            return self._values[FLOORPLAN_INDEX].get("InnerTree")
+        return self.tree(FLOORPLAN_PARAM)
+
+    @property
+    def text(self):
+        #Text der "Tx" Ausgabe, None wenn das Skript keinen Text geliefert hat
+        text_inner_tree = self._trees.get(TEXT_PARAM)
+        if not (text_inner_tree and '{0}' in text_inner_tree):
+            return None
+        return text_inner_tree['{0}'][0]['data']
+
+
+@instrumented()
+def hops_response(output) -> HopsResponse:
+    #Bereits geparste Ergebnisse werden durchgereicht
+    return output if isinstance(output, HopsResponse) else HopsResponse(output)
+
+
+@instrumented()
+@lru_cache(maxsize=32)
+def parse_tx_text(text_data) -> TxResult:
+    #Zwischengespeichert pro Text, mehrere Views mit demselben Hops Ergebnis parsen nur einmal
+    return parse_tx(text_data)
+
+@instrumented()
+def parse_text_output(output):
+    #Liest die "Tx" Ausgabe eines Hops Ergebnisses (roh oder HopsResponse) und gibt (parameter_data, wetterdaten) zurück
+    text_data = hops_response(output).text
+    if text_data is None:
+        print("Keine Daten gefunden")
+        return {}, {}
+    return parse_tx_text(text_data).as_dicts()
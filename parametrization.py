@@ -8,6 +8,8 @@ from viktor.parametrization import (
     Text,
     ViktorParametrization,
     BooleanField,
+    OptionField,
+    FileField,
 )
 
 
@@ -39,6 +41,7 @@ Die App zielt darauf ab, eine einfache und schnelle Möglichkeit zu bieten, Tiny
     step_1.styling = Section("Kartendarstellung")
     step_1.styling.opacity = NumberField("Opazität", variant="slider", min=0, max=1, step=0.1, default=0.5)
     step_1.styling.line_width = NumberField("Linienstärke", variant="slider", min=0, max=5, default=1)
+    step_1.styling.detail = OptionField("Detailgrad", options=["Hoch", "Mittel", "Niedrig"], default="Mittel", description="Detailgrad der Klimazonen-Grenzen. Eine geringere Stufe lädt schneller, die Klimazone am Standort wird immer mit voller Auflösung bestimmt.")
     step_1.styling.showlegend = BooleanField("Legende Anzeigen", description="Aussuchen ob die Legende der Köppen-Geiger Klimakarte angezeigt werden soll. Sollte auf mobilen Geräten aus bleiben.")
 
 #Step 2 Ist Festlegen von Parametern für Das Gebäude sowie laufen lassen der Simulation
@@ -49,9 +52,24 @@ Die App zielt darauf ab, eine einfache und schnelle Möglichkeit zu bieten, Tiny
     step_2.geometrie.Raumhöhe = NumberField("Raumhöhe", variant="slider", min=2.3, max=4, step=0.1, default=2.5)
     step_2.geometrie.AzimutRichtungEingang = NumberField('Azimut Richtung Eingang', min=0, max=360, default=90, variant='slider', description="Richtung des Eingangs in Grad. 0° = Norden 90° = Osten etc.")
 
+    step_2.darstellung = Section("Darstellung")
+    step_2.darstellung.modell = OptionField("3D Modell", options=["Automatisch", "Exakt (3dm)", "Vorschau (glTF)"], default="Automatisch", description="Die Vorschau enthält nur Dreiecksnetze und Linien und lädt bei großen Entwürfen deutlich schneller. Automatisch wählt die Vorschau ab einer bestimmten Anzahl an Objekten.")
+    step_2.darstellung.vereinfachung = NumberField("Vereinfachung der Vorschau", variant="slider", min=0, max=0.5, step=0.05, default=0, suffix="m", description="Rasterweite, auf die die Netze der Vorschau vereinfacht werden. 0 = keine Vereinfachung.")
+
 
     Step('Step 2', previous_label='Zurück zu Step 1', next_label='Zu Step 3')
 
 #Step 3 Ist Festlegen von Parametern für Das Gebäude
 
-    step_3 = Step('Step - 3 Daten', views=["run_data_analysis", "run_weather_data"])
\ No newline at end of file
+    step_3 = Step('Step - 3 Daten', views=["run_data_analysis", "run_weather_data"])
+
+#Step 4 Ist der Vergleich vieler Standorte auf einmal
+
+    step_4 = Step('Step - 4 Standortvergleich', views=["run_batch_screening"])
+    step_4.standorte = Section("Standorte")
+    step_4.standorte.text = Text("""
+Lade eine CSV mit mehreren Standorten hoch, um sie in einer Tabelle zu vergleichen.
+Benötigte Spalten: **lat** und **lon**, optional **Raumhöhe** und **Azimut**. Trennzeichen ";" oder ",".
+Zeilen mit fehlenden oder ungültigen Werten erscheinen in der Tabelle als "Ungültige Zeile".
+""")
+    step_4.standorte.csv_file = FileField("CSV mit Standorten", file_types=[".csv"])
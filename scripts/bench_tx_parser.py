@@ -0,0 +1,69 @@
+#Vergleicht den bisherigen Tx Parser mit parse_tx auf großen synthetischen Ausgaben
+#z.B. stündliche statt monatliche Wetterdaten (8760 Zeilen pro Metrik)
+#Aufruf aus dem Projektordner: python -m scripts.bench_tx_parser
+
+import random
+import timeit
+
+from json_utils import MONATE, parse_tx
+
+REPEATS = 5
+
+#Tage pro Monat für ein Jahr ohne Schalttag
+TAGE = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def legacy_parse_data_string(text_lines):
+    #Nachbau des bisherigen Parsers, nur für den Vergleich
+    parameter_data = {}
+    wetterdaten = {}
+    for line in text_lines:
+        line = line.strip().strip('"')
+        if ' = ' in line:
+            key, value = line.split(' = ', 1)
+            if "weil" in value:
+                value, begründung = value.split("weil", 1)
+                begründung = begründung.strip()
+            else:
+                begründung = ""
+            if any(monat in key for monat in MONATE):
+                monat = key.split()[1]
+                if monat not in wetterdaten:
+                    wetterdaten[monat] = {}
+                if "Schneefall" in key:
+                    wetterdaten[monat]["Schneefall [mm]"] = float(value)
+                elif "Niederschlag" in key:
+                    wetterdaten[monat]["Niederschlag [mm]"] = float(value)
+            else:
+                parameter_data[key.strip()] = {"value": value.strip(), "begründung": begründung}
+    return parameter_data, wetterdaten
+
+def legacy_parse(text):
+    #Bisheriger Ablauf in den Views: replace + splitlines + parse_data_string
+    return legacy_parse_data_string(text.replace("\\r\\n", "\n").splitlines())
+
+
+def synthetic_tx(hourly=True, parameters=200, seed=0) -> str:
+    #Text im Format der Grasshopper "Tx" Ausgabe mit escapten Zeilenumbrüchen
+    rng = random.Random(seed)
+    lines = [f'"Parameter {i} = {rng.random():.3f} weil Begründung {i}"' for i in range(parameters)]
+    for monat, tage in zip(MONATE, TAGE):
+        steps = tage * 24 if hourly else 1
+        for step in range(steps):
+            lines.append(f'"Niederschlag {monat} {step} = {rng.random() * 10:.2f}"')
+            lines.append(f'"Schneefall {monat} {step} = {rng.random() * 5:.2f}"')
+    return "\\r\\n".join(lines)
+
+
+def main():
+    print(f"{'Eingabe':<22}{'Zeilen':>8}{'alt [ms]':>12}{'neu [ms]':>12}{'Faktor':>9}")
+    for name, text in (("monatlich", synthetic_tx(hourly=False)), ("stündlich", synthetic_tx(hourly=True))):
+        assert legacy_parse(text) == parse_tx(text).as_dicts()
+        lines = text.count("\\r\\n") + 1
+        legacy = min(timeit.repeat(lambda: legacy_parse(text), number=1, repeat=REPEATS))
+        new = min(timeit.repeat(lambda: parse_tx(text), number=1, repeat=REPEATS))
+        print(f"{name:<22}{lines:>8}{legacy * 1000:>12.2f}{new * 1000:>12.2f}{legacy / new:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#Offline Vorberechnung des Entwurfsatlas für alle Klimazonen x Raumhöhen x Azimutklassen
+#Die Koordinaten werden in Rasterzellen zusammengefasst, pro Zelle und Klimazone wird ein
+#repräsentativer Punkt der Zone in dieser Zelle gerechnet
+#Bereits fertige Einträge werden übersprungen, fehlgeschlagene beim nächsten Aufruf erneut gerechnet
+#Aufruf aus dem Projektordner: python -m scripts.build_atlas [--zonen Cfb,Dfb] [--limit 100]
+
+import json
+import time
+import argparse
+from concurrent.futures import as_completed
+
+import shapely
+from shapely.geometry import box
+
+from design_atlas import (
+    ATLAS_PATH, ATLAS_RAUMHOEHEN, ATLAS_AZIMUT_STEP, ATLAS_CELL_DEGREES, DONE, FAILED,
+    atlas_key, coordinate_cell, open_atlas_db, pack_blob,
+)
+from geometry_utils import build_3dm_bytes
+from gis_functions import get_climate_gdf, find_climate_zone
+from hops_cache import script_fingerprint, cache_stats
+from hops_jobs import HOPS_WORKERS, HopsJobScheduler
+from hops_params import normalize_hops_params
+from json_utils import HopsResponse, parse_text_output
+from scripts.build_lod import dissolve_zones
+
+#Anzahl eingereichter Analysen pro Worker, damit nicht das ganze Raster auf einmal in der Warteschlange liegt
+QUEUE_DEPTH = 4
+
+
+def atlas_sites(cell_degrees, zones=None) -> list:
+    #(Klimazone, Breitengrad, Längengrad) je Rasterzelle und darin vorkommender Klimazone
+    dissolved = dissolve_zones(get_climate_gdf())
+    gdf = get_climate_gdf()
+    sites = []
+    for zone, geometry in zip(dissolved['climate'], dissolved.geometry):
+        if zones and zone.split()[0] not in zones:
+            continue
+        minx, miny, maxx, maxy = geometry.bounds
+        for cell_lat in range(int(miny // cell_degrees), int(maxy // cell_degrees) + 1):
+            for cell_lon in range(int(minx // cell_degrees), int(maxx // cell_degrees) + 1):
+                cell = box(cell_lon * cell_degrees, cell_lat * cell_degrees, (cell_lon + 1) * cell_degrees, (cell_lat + 1) * cell_degrees)
+                part = shapely.intersection(geometry, cell)
+                if part.is_empty or part.area == 0:
+                    continue
+                point = part.representative_point()
+                latitude, longitude = round(point.y, 2), round(point.x, 2)
+                #Nach dem Runden muss der Punkt noch in derselben Zelle und Zone liegen, sonst passt der Schlüssel nicht
+                if coordinate_cell(latitude, longitude, cell_degrees) != (cell_lat, cell_lon):
+                    continue
+                if find_climate_zone(gdf, latitude, longitude) == zone:
+                    sites.append((zone, latitude, longitude))
+    return sites
+
+def atlas_tasks(sites, cell_degrees, azimut_step):
+    for zone, latitude, longitude in sites:
+        for raumhoehe in ATLAS_RAUMHOEHEN:
+            for azimut in range(0, 360, azimut_step):
+                key = atlas_key(zone, latitude, longitude, raumhoehe, azimut, cell_degrees, azimut_step)
+                formatted_params = normalize_hops_params(dict(
+                    Raumhöhe=raumhoehe,
+                    Längengrad=longitude,
+                    Breitangrad=latitude,
+                    Klimazone=zone,
+                    AzimutRichtungEingang=azimut
+                ))
+                yield key, formatted_params
+
+
+def write_meta(connection, cell_degrees, azimut_step):
+    meta = {
+        "script_fingerprint": script_fingerprint(),
+        "cell_degrees": str(cell_degrees),
+        "azimut_step": str(azimut_step),
+        "raumhoehen": json.dumps(ATLAS_RAUMHOEHEN),
+    }
+    existing = dict(connection.execute("SELECT name, value FROM meta"))
+    for name in ("script_fingerprint", "cell_degrees", "azimut_step"):
+        if name in existing and existing[name] != meta[name]:
+            raise SystemExit(f"Der Atlas wurde mit {name}={existing[name]} gebaut, bitte neue Datei angeben oder die alte löschen")
+    connection.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", meta.items())
+    connection.commit()
+
+def write_points_meta(connection, sites, cell_degrees):
+    #Repräsentativer Punkt je (Klimazone, Zelle) in meta, ergänzt die Punkte früherer Läufe (z.B. mit --zonen)
+    row = connection.execute("SELECT value FROM meta WHERE name = 'representative_points'").fetchone()
+    points = json.loads(row[0]) if row else {}
+    for zone, latitude, longitude in sites:
+        cell = json.dumps([zone, *coordinate_cell(latitude, longitude, cell_degrees)], ensure_ascii=False)
+        points[cell] = [latitude, longitude]
+    connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                       ("representative_points", json.dumps(points, ensure_ascii=False)))
+    connection.commit()
+
+def store_result(connection, key, formatted_params, output=None, error=None):
+    latitude, longitude = formatted_params["Breitangrad"], formatted_params["Längengrad"]
+    if error is None:
+        response = HopsResponse(output)
+        parameter_data, wetterdaten = parse_text_output(response)
+        row = (*key, latitude, longitude, DONE, None,
+               pack_blob(build_3dm_bytes(response.geometry)), pack_blob(build_3dm_bytes(response.floorplan)),
+               json.dumps(parameter_data, ensure_ascii=False), json.dumps(wetterdaten, ensure_ascii=False))
+    else:
+        row = (*key, latitude, longitude, FAILED, str(error), None, None, None, None)
+    connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entwurfsatlas vorberechnen")
+    parser.add_argument("--ausgabe", default=str(ATLAS_PATH))
+    parser.add_argument("--zellen-grad", type=float, default=ATLAS_CELL_DEGREES)
+    parser.add_argument("--azimut-schritt", type=int, default=ATLAS_AZIMUT_STEP)
+    parser.add_argument("--zonen", default="", help="Kürzel der Klimazonen, z.B. Cfb,Dfb (Standard: alle)")
+    parser.add_argument("--workers", type=int, default=HOPS_WORKERS)
+    parser.add_argument("--limit", type=int, default=0, help="Höchstens so viele neue Analysen rechnen")
+    args = parser.parse_args()
+
+    connection = open_atlas_db(args.ausgabe)
+    write_meta(connection, args.zellen_grad, args.azimut_schritt)
+    done = set(connection.execute("SELECT klimazone, cell_lat, cell_lon, raumhoehe, azimut FROM entries WHERE status = ?", (DONE,)))
+
+    zones = {zone.strip() for zone in args.zonen.split(",") if zone.strip()}
+    sites = atlas_sites(args.zellen_grad, zones)
+    write_points_meta(connection, sites, args.zellen_grad)
+    tasks = [task for task in atlas_tasks(sites, args.zellen_grad, args.azimut_schritt) if task[0] not in done]
+    if args.limit:
+        tasks = tasks[:args.limit]
+    print(f"{len(sites)} Standorte, {len(done)} Entwürfe fertig, {len(tasks)} zu rechnen mit {args.workers} Workern")
+
+    scheduler = HopsJobScheduler(max_workers=args.workers)
+    start = time.perf_counter()
+    pending = {}
+    finished = failed = 0
+    tasks = iter(tasks)
+    while True:
+        #Fenster begrenzter Größe nachfüllen
+        for key, formatted_params in tasks:
+            job = scheduler.submit_job(formatted_params)
+            pending[job.future] = (key, formatted_params, job)
+            if len(pending) >= args.workers * QUEUE_DEPTH:
+                break
+        if not pending:
+            break
+
+        future = next(as_completed(pending))
+        key, formatted_params, job = pending.pop(future)
+        try:
+            store_result(connection, key, formatted_params, output=job.get_result())
+            finished += 1
+        except Exception as error:
+            store_result(connection, key, formatted_params, error=error)
+            failed += 1
+            print(f"Fehlgeschlagen {key}: {error}")
+        if (finished + failed) % 100 == 0:
+            print(f"{finished + failed} Analysen, {failed} Fehler, {time.perf_counter() - start:.0f} s")
+
+    connection.execute("VACUUM")
+    connection.close()
+    print(f"Fertig: {finished} neu, {failed} fehlgeschlagen, {cache_stats['hits']} aus dem Hops Cache, {time.perf_counter() - start:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
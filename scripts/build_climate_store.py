@@ -0,0 +1,35 @@
+#Wandelt files/raw-data.json in das binäre Spaltenformat (files/koeppen) um
+#Übernommen werden nur Geometrie und Klimazone, die UUIDs in identity/id braucht die App nicht
+#Aufruf aus dem Projektordner: python -m scripts.build_climate_store
+
+import time
+
+import geopandas as gpd
+
+from climate_store import write_climate_store
+from gis_functions import CLIMATE_DATA_PATH, CLIMATE_STORE_DIRECTORY, ClimateDataStore, load_columnar_climate_gdf
+
+
+def main():
+    source = gpd.read_file(CLIMATE_DATA_PATH)
+    meta = write_climate_store(source.geometry.values, source['climate'].tolist(), CLIMATE_STORE_DIRECTORY,
+                               source_path=CLIMATE_DATA_PATH, crs=source.crs.to_string())
+
+    #Gegenprobe: dieselben Polygone und Zonen wie beim Einlesen des GeoJSON
+    start = time.perf_counter()
+    columnar, _ = load_columnar_climate_gdf(CLIMATE_STORE_DIRECTORY, CLIMATE_DATA_PATH)
+    columnar_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    geojson = ClimateDataStore(CLIMATE_DATA_PATH).get()
+    geojson_seconds = time.perf_counter() - start
+    assert columnar.geometry.geom_equals_exact(geojson.geometry, tolerance=0).all()
+    assert (columnar['climate'].astype(str) == geojson['climate'].astype(str)).all()
+
+    size = sum(path.stat().st_size for path in CLIMATE_STORE_DIRECTORY.iterdir())
+    print(f"{len(columnar)} Polygone, {len(meta['zones'])} Zonen, Koordinatenfaktor {meta['coordinate_scale']}")
+    print(f"GeoJSON:  {CLIMATE_DATA_PATH.stat().st_size / 1024:>8.0f} kB  {geojson_seconds * 1000:>8.0f} ms")
+    print(f"Binär:    {size / 1024:>8.0f} kB  {columnar_seconds * 1000:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
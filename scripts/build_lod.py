@@ -0,0 +1,53 @@
+#Offline Vorverarbeitung der Köppen-Geiger Karte in Detailstufen für die Kartenansicht
+#Polygone gleicher Klimazone werden zusammengeführt (dissolve) und danach je Stufe
+#als Coverage vereinfacht, d.h. gemeinsame Grenzen benachbarter Zonen bleiben deckungsgleich
+#Aufruf aus dem Projektordner: python -m scripts.build_lod
+
+import time
+
+import shapely
+from geopandas import GeoDataFrame
+
+from gis_functions import LOD_DIRECTORY, LOD_TIERS, get_climate_gdf, lod_path
+
+#Die Rohdaten liegen auf einem 0.1° Raster, feinere Koordinaten bringen keine Information
+GRID_SIZE = 0.1
+
+
+def dissolve_zones(gdf) -> GeoDataFrame:
+    gdf = gdf[['climate', 'geometry']].copy()
+    gdf['climate'] = gdf['climate'].astype(str)
+    return gdf.dissolve(by='climate', as_index=False)
+
+
+def simplify_zones(geometries, tolerance):
+    if tolerance > 0 and hasattr(shapely, "coverage_simplify"):
+        geometries = shapely.coverage_simplify(geometries, tolerance)
+    else:
+        #Ältere GEOS Versionen: pro Polygon vereinfachen, bei tolerance 0 nur kollineare Punkte entfernen
+        geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    geometries = shapely.set_precision(geometries, GRID_SIZE)
+    return shapely.make_valid(geometries)
+
+
+def main():
+    LOD_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    dissolved = dissolve_zones(get_climate_gdf())
+
+    print(f"{'Stufe':<10}{'Toleranz':>10}{'Punkte':>10}{'Größe [kB]':>12}{'Zeit [s]':>10}")
+    for tier, tolerance in LOD_TIERS.items():
+        start = time.perf_counter()
+        geometries = simplify_zones(dissolved.geometry.values, tolerance)
+        tier_gdf = GeoDataFrame({'climate': dissolved['climate']}, geometry=geometries, crs=dissolved.crs)
+        tier_gdf = tier_gdf[~tier_gdf.geometry.is_empty]
+
+        path = lod_path(tier)
+        path.unlink(missing_ok=True)
+        tier_gdf.to_file(path, driver="GeoJSON", COORDINATE_PRECISION=1, RFC7946="YES")
+
+        points = shapely.get_num_coordinates(tier_gdf.geometry.values).sum()
+        print(f"{tier:<10}{tolerance:>10}{points:>10}{path.stat().st_size / 1024:>12.1f}{time.perf_counter() - start:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#Vergleicht Speicherbedarf und Ladezeit des alten get_gdf (raw-data.json pro Aufruf neu einlesen)
+#mit den zwischengespeicherten Stores (GeoJSON und binäres Spaltenformat)
+#Aufruf aus dem Projektordner: python -m scripts.gdf_report
+
+import time
+from types import SimpleNamespace
+
+import geopandas as gpd
+
+from gis_functions import (CLIMATE_DATA_PATH, CLIMATE_STORE_DIRECTORY, ClimateDataStore, ColumnarClimateStore,
+                           climate_colors, get_gdf)
+import gis_functions
+
+REPEATS = 5
+
+
+def legacy_get_gdf(styling):
+    #Nachbau des bisherigen Pfads, nur für den Vergleich
+    gdf = gpd.read_file(CLIMATE_DATA_PATH, crs=4326)
+    gdf = gdf.to_crs("EPSG:4326")
+    gdf["fill-opacity"] = styling.opacity
+    gdf["stroke-width"] = styling.line_width
+    gdf["description"] = "Klimazone: " + gdf['climate'].astype(str) + "  \n  "
+    gdf['fill'] = gdf['climate'].map(climate_colors)
+    return gdf
+
+
+def frame_memory(gdf):
+    #Speicher der Spalten inkl. Python Strings, Geometrien werden mit ihrer WKB Größe geschätzt
+    columns = gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True, index=True).sum()
+    geometries = gdf.geometry.to_wkb().map(len).sum()
+    return columns + geometries
+
+
+def timed(func, repeats=REPEATS):
+    durations = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return result, durations
+
+
+def main():
+    styling = SimpleNamespace(opacity=0.5, line_width=1)
+
+    legacy_gdf, legacy_times = timed(lambda: legacy_get_gdf(styling))
+
+    #Frische Stores, damit der erste Aufruf jeweils den Kaltstart misst
+    #get_gdf liest das binäre Format, solange es vorhanden und aktuell ist, sonst das GeoJSON
+    gis_functions._climate_store = ClimateDataStore(CLIMATE_DATA_PATH)
+    geojson_gdf, geojson_times = timed(gis_functions._climate_store.get, repeats=1)
+    gis_functions._columnar_store = ColumnarClimateStore(CLIMATE_STORE_DIRECTORY, CLIMATE_DATA_PATH)
+    _, cold_times = timed(lambda: get_gdf(styling), repeats=1)
+    new_gdf, warm_times = timed(lambda: get_gdf(styling))
+    base_gdf = gis_functions.get_climate_gdf()
+    source = "binär" if gis_functions.get_raw_store() is gis_functions._columnar_store else "GeoJSON"
+
+    rows = [
+        ("alt: get_gdf", min(legacy_times), frame_memory(legacy_gdf)),
+        ("neu: GeoJSON laden", geojson_times[0], frame_memory(geojson_gdf)),
+        (f"neu: erster Aufruf ({source})", cold_times[0], frame_memory(base_gdf)),
+        ("neu: weitere Aufrufe", min(warm_times), frame_memory(new_gdf) - frame_memory(base_gdf)),
+    ]
+
+    print(f"{'Pfad':<32}{'Zeit [ms]':>12}{'Speicher [kB]':>16}")
+    for name, duration, memory in rows:
+        print(f"{name:<32}{duration * 1000:>12.2f}{memory / 1024:>16.1f}")
+    print("Speicher bei 'weitere Aufrufe' = nur die pro Anfrage gesetzten Stylespalten")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#Bericht über die Startzeit eines Workers: Importzeit von app.py je Paket, Speicher nach dem Import
+#und nach preload() (Klimadaten, Detailstufen, GeoJSON der Standardansicht)
+#Jede Messung läuft in einem frischen Python Prozess
+#Aufruf aus dem Projektordner: python -m scripts.import_report [--json bericht.json]
+
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+PROJECT_DIRECTORY = Path(__file__).parent.parent
+
+#Wird im Messprozess ausgeführt, gibt die Ergebnisse als JSON auf stdout aus
+MEASURE = """
+import json, resource, sys, time
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+start = time.perf_counter()
+import app
+result = {"import_seconds": time.perf_counter() - start, "import_rss_mb": rss_mb()}
+heavy = ("geopandas", "rhino3dm", "viktor.external.grasshopper")
+result["loaded_after_import"] = [name for name in heavy if name in sys.modules]
+if PRELOAD:
+    from startup import preload
+    start = time.perf_counter()
+    result["preload_steps"] = preload()
+    result["preload_seconds"] = time.perf_counter() - start
+    result["preload_rss_mb"] = rss_mb()
+print(json.dumps(result))
+"""
+
+
+def measure(preload) -> dict:
+    code = f"PRELOAD = {preload!r}\n" + MEASURE
+    completed = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_DIRECTORY, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def import_times() -> dict:
+    #Kumulierte Importzeit je Top-Level Paket aus python -X importtime
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=PROJECT_DIRECTORY,
+                               capture_output=True, text=True, check=True)
+    packages = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        #Nur Einträge direkt unter app bzw. auf oberster Ebene
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            package = name.strip().split(".")[0]
+            packages[package] = max(packages.get(package, 0), int(cumulative) / 1e6)
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startzeit und Speicher eines Workers messen")
+    parser.add_argument("--json", help="Ergebnis zusätzlich als JSON Datei speichern")
+    args = parser.parse_args()
+
+    packages = import_times()
+    cold = measure(preload=False)
+    preloaded = measure(preload=True)
+
+    print(f"{'Paket':<32}{'Import [s]':>12}")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+        print(f"{package:<32}{seconds:>12.3f}")
+    print()
+    print(f"import app: {cold['import_seconds']:.2f} s, {cold['import_rss_mb']:.0f} MB RSS")
+    print(f"Nach dem Import geladen: {', '.join(cold['loaded_after_import']) or 'keine schweren Module'}")
+    print(f"preload(): {preloaded['preload_seconds']:.2f} s, {preloaded['preload_rss_mb']:.0f} MB RSS")
+    for name, seconds in preloaded["preload_steps"].items():
+        print(f"  {name:<36}{seconds:>8.3f} s")
+
+    if args.json:
+        report = {"packages": packages, "cold": cold, "preloaded": preloaded}
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
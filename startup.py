@@ -0,0 +1,44 @@
+import gc
+import os
+import time
+import importlib
+from types import SimpleNamespace
+
+from gis_functions import LOD_TIERS, get_climate_gdf, get_display_store, get_geojson_payload, create_legend
+
+
+#TINYHOUSE_PRELOAD=1 lädt Abhängigkeiten und Daten schon beim Import von app.py,
+#sinnvoll wenn der Server app.py einmal im Elternprozess importiert und danach die Worker forkt
+PRELOAD = os.environ.get("TINYHOUSE_PRELOAD", "").strip().lower() in ("1", "true", "yes")
+
+#Schwere Module, die sonst erst beim ersten passenden View geladen werden
+HEAVY_MODULES = ("geopandas", "rhino3dm", "viktor.external.grasshopper")
+
+#Standardwerte der Kartenansicht aus der Parametrisierung
+DEFAULT_STYLING = SimpleNamespace(opacity=0.5, line_width=1, detail="Mittel")
+
+
+def preload(freeze=True) -> dict:
+    #Lädt Module, Klimadaten, Detailstufen und das GeoJSON der Standardansicht einmal
+    #Gibt die Dauer pro Schritt in Sekunden zurück
+    steps = {}
+
+    def step(name, load):
+        start = time.perf_counter()
+        load()
+        steps[name] = time.perf_counter() - start
+
+    for module in HEAVY_MODULES:
+        step(f"import {module}", lambda: importlib.import_module(module))
+    step("Klimadaten", get_climate_gdf)
+    for tier in LOD_TIERS:
+        step(f"Detailstufe {tier}", get_display_store(tier).get)
+    step("GeoJSON Standardansicht", lambda: get_geojson_payload(DEFAULT_STYLING))
+    step("Legende", create_legend)
+
+    if freeze and hasattr(gc, "freeze"):
+        #Vorgeladene Objekte aus der Garbage Collection nehmen, damit geforkte Worker
+        #die Speicherseiten nicht durch Referenzzählung der GC kopieren
+        gc.collect()
+        gc.freeze()
+    return steps
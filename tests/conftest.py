@@ -0,0 +1,138 @@
+#Gemeinsame Fixtures der Benchmarks, alles läuft offline gegen aufgezeichnete Hops Antworten
+#Aufruf: python -m pytest tests --benchmark-storage=file://tests/benchmarks --benchmark-compare=0001 --benchmark-compare-fail=mean:25%
+#Neue Baseline: python -m pytest tests --benchmark-storage=file://tests/benchmarks --benchmark-save=baseline
+#Die Baseline gilt nur für den Rechner, auf dem sie aufgenommen wurde, und nur für die Benchmarks dieses Stands
+#Nach neuen oder geänderten Benchmarks die alte 0001_baseline.json löschen und neu aufnehmen, sonst fehlen Einträge
+
+import time
+from contextlib import nullcontext
+
+import pytest
+from munch import Munch
+
+import design_pipeline
+import geometry_utils
+import hops_cache
+import hops_jobs
+from tests.fake_hops import FakeGrasshopperAnalysis, load_recording
+
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    #Ohne pytest-benchmark laufen die Benchmarks einmal als normale Tests
+
+    class _SingleRun:
+        def __init__(self):
+            self.extra_info = {}
+
+        def __call__(self, function, *args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.seconds = time.perf_counter() - start
+            return result
+
+        def pedantic(self, function, args=(), kwargs=None, setup=None, rounds=1, iterations=1, warmup_rounds=0):
+            if setup is not None:
+                setup()
+            return self(function, *args, **(kwargs or {}))
+
+    @pytest.fixture
+    def benchmark():
+        return _SingleRun()
+
+
+class MemoryCache:
+    #Ersetzt den Festplatten-Cache, damit jede Runde gezielt kalt oder warm starten kann
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, data):
+        self.entries[key] = data
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def key_lock(self, key):
+        return nullcontext()
+
+
+@pytest.fixture(scope="session")
+def recording():
+    return load_recording()
+
+@pytest.fixture
+def fake_hops(monkeypatch):
+    #Der Standard-Runner importiert GrasshopperAnalysis erst beim Aufruf, deswegen reicht das Ersetzen im Modul
+    import viktor.external.grasshopper
+
+    FakeGrasshopperAnalysis.reset()
+    monkeypatch.setattr(viktor.external.grasshopper, "GrasshopperAnalysis", FakeGrasshopperAnalysis)
+    monkeypatch.setattr(hops_cache, "_hops_runner", None)
+    monkeypatch.delenv("TINYHOUSE_HOPS_RUNNER", raising=False)
+    return FakeGrasshopperAnalysis
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    cache = MemoryCache()
+    monkeypatch.setattr(hops_cache, "_disk_cache", cache)
+    #Abgeschlossene Jobs des Schedulers würden sonst zwischen den Tests geteilt
+    monkeypatch.setattr(hops_jobs, "_scheduler", None)
+    monkeypatch.setattr(hops_jobs, "_batch_scheduler", None)
+    monkeypatch.setattr(geometry_utils, "_model_cache", geometry_utils.BytesLRU(geometry_utils.MODEL_CACHE_MAX_BYTES))
+    #Ein vorhandener Entwurfsatlas würde die Hops Analyse überspringen
+    monkeypatch.setattr(design_pipeline, "get_atlas", lambda: None)
+    design_pipeline._pipelines.clear()
+    design_pipeline._sites.clear()
+    yield cache
+    design_pipeline._pipelines.clear()
+    design_pipeline._sites.clear()
+
+@pytest.fixture
+def clear_design_caches(memory_cache):
+    #Setup-Funktion für kalte Runden: Pipelines und Modell-Caches (.3dm und GLB) leeren, das Hops Ergebnis bleibt im Cache
+    def clear():
+        design_pipeline._pipelines.clear()
+        geometry_utils._model_cache = geometry_utils.BytesLRU(geometry_utils.MODEL_CACHE_MAX_BYTES)
+        for key in list(memory_cache.entries):
+            for param_name in ("Geometry", "Floorplan"):
+                for model_format in ("3dm", "glb:0"):
+                    memory_cache.delete(geometry_utils.model_cache_key(key, param_name, model_format))
+    return clear
+
+@pytest.fixture
+def decode_workers(monkeypatch):
+    #Erzwingt den Worker-Pool der GLB Vorschau auch auf einem Kern, der Pool wird danach wieder beendet
+    def use(workers, threshold=geometry_utils.PARALLEL_DECODE_THRESHOLD):
+        monkeypatch.setattr(geometry_utils, "DECODE_WORKERS", workers)
+        monkeypatch.setattr(geometry_utils, "PARALLEL_DECODE_THRESHOLD", threshold)
+    monkeypatch.setattr(geometry_utils, "_decode_pool", None)
+    yield use
+    if geometry_utils._decode_pool is not None:
+        geometry_utils._decode_pool.shutdown()
+
+
+def make_params(lat=49.8728, lon=8.6512, raumhoehe=2.5, azimut=90, detail="Mittel", showlegend=True,
+                modell="Automatisch", vereinfachung=0):
+    return Munch.fromDict({
+        "step_1": {
+            "styling": {"opacity": 0.5, "line_width": 1, "showlegend": showlegend, "detail": detail},
+            "point": {"GeoPointField": Munch(lat=lat, lon=lon)},
+        },
+        "step_2": {
+            "geometrie": {"Raumhöhe": raumhoehe, "AzimutRichtungEingang": azimut},
+            "darstellung": {"modell": modell, "vereinfachung": vereinfachung},
+        },
+        "step_4": {},
+    })
+
+@pytest.fixture
+def params():
+    return make_params()
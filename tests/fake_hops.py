@@ -0,0 +1,102 @@
+#Lokaler Ersatz für viktor.external.grasshopper.GrasshopperAnalysis, liefert aufgezeichnete Hops Antworten
+#Neue Aufzeichnung gegen ein echtes Rhino.Compute: python -m tests.fake_hops
+
+import gzip
+import json
+import copy
+from pathlib import Path
+
+import rhino3dm
+
+RECORDINGS_DIRECTORY = Path(__file__).parent / "recordings"
+DEFAULT_RECORDING = RECORDINGS_DIRECTORY / "darmstadt_2.5_90.json.gz"
+
+#Parameter der Standardaufzeichnung, entsprechen den Standardwerten der Parametrisierung
+DEFAULT_PARAMS = {
+    "Raumhöhe": 2.5,
+    "Längengrad": 8.65,
+    "Breitangrad": 49.87,
+    "Klimazone": "Cfb Temperate-Withouth_dry_season-Warm_Summer",
+    "AzimutRichtungEingang": 90.0,
+}
+
+
+def load_recording(path=DEFAULT_RECORDING) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as recording:
+        return json.load(recording)
+
+def save_recording(output, path=DEFAULT_RECORDING):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=9) as recording:
+        json.dump(output, recording)
+
+
+def scaled_response(output, geometry_items=None, floorplan_items=None) -> dict:
+    #Vergrößert oder verkleinert die InnerTrees einer Aufzeichnung für Skalierungs-Benchmarks
+    #Die vorhandenen Items werden zyklisch wiederholt, das Schema bleibt das von Hops
+    output = copy.deepcopy(output)
+    counts = {"Geometry": geometry_items, "Floorplan": floorplan_items}
+    for value in output["values"]:
+        target = counts.get(value["ParamName"])
+        if target is None:
+            continue
+        items = [item for key in value["InnerTree"] for item in value["InnerTree"][key]]
+        value["InnerTree"] = {"{0}": [items[i % len(items)] for i in range(target)]}
+    return output
+
+def box_items(count, size=1.0) -> list:
+    #Hops Items mit einfachen Brep Quadern, z.B. für künstlich große Antworten
+    items = []
+    for i in range(count):
+        bounding_box = rhino3dm.BoundingBox(i * size, 0, 0, (i + 1) * size, size, size)
+        brep = rhino3dm.Brep.CreateFromBoundingBox(bounding_box)
+        items.append({"type": "Rhino.Geometry.Brep", "data": json.dumps(brep.Encode())})
+    return items
+
+
+class FakeGrasshopperAnalysis:
+    #Gleiche Schnittstelle wie GrasshopperAnalysis: execute() und get_output()
+    #Zu einem Parametersatz ohne eigene Aufzeichnung wird die Standardaufzeichnung geliefert
+
+    responses = {}
+    calls = []
+
+    def __init__(self, script, input_parameters):
+        self.script = script
+        self.input_parameters = input_parameters
+        self._output = None
+
+    @classmethod
+    def serve(cls, output, formatted_params=None):
+        key = None if formatted_params is None else json.dumps(formatted_params, sort_keys=True)
+        cls.responses[key] = output
+
+    @classmethod
+    def reset(cls):
+        cls.responses = {}
+        cls.calls = []
+
+    def execute(self, timeout=None):
+        FakeGrasshopperAnalysis.calls.append(self.input_parameters)
+        key = json.dumps(self.input_parameters, sort_keys=True)
+        output = self.responses.get(key, self.responses.get(None))
+        if output is None:
+            output = load_recording()
+        self._output = output
+
+    def get_output(self):
+        return self._output
+
+
+def main():
+    #Nimmt die Standardantwort über den echten Hops Runner auf (benötigt Rhino.Compute)
+    from hops_cache import run_hops_analysis
+
+    output = run_hops_analysis(DEFAULT_PARAMS)
+    save_recording(output)
+    sizes = {value["ParamName"]: sum(len(items) for items in value["InnerTree"].values()) for value in output["values"]}
+    print(f"Aufzeichnung gespeichert in {DEFAULT_RECORDING}: {sizes}")
+
+
+if __name__ == "__main__":
+    main()
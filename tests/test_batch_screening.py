@@ -0,0 +1,96 @@
+import pytest
+from viktor.errors import UserError
+
+import hops_cache
+from hops_cache import analysis_key
+from batch_screening import DEFAULT_AZIMUT, DEFAULT_RAUMHOEHE, read_sites_csv, screen_sites, summary_table
+from hops_jobs import MAX_FINISHED_JOBS, HopsJobScheduler
+
+
+class InstantScheduler(HopsJobScheduler):
+    #Jeder Job ist fertig bevor der nächste eingereicht wird, wie bei einem warmen Festplatten-Cache
+
+    def submit_job(self, formatted_params):
+        job = super().submit_job(formatted_params)
+        job.done_event.wait(5)
+        return job
+
+
+################################################
+# CSV einlesen                                 #
+################################################
+
+@pytest.mark.parametrize("delimiter", [";", ",", "\t"], ids=["semikolon", "komma", "tab"])
+def test_read_sites_csv_delimiters(delimiter):
+    source = delimiter.join(["lat", "lon", "Raumhöhe", "Azimut"]) + "\n" + delimiter.join(["49.87", "8.65", "2.7", "180"]) + "\n"
+    assert read_sites_csv(source) == [{"lat": 49.87, "lon": 8.65, "raumhoehe": 2.7, "azimut": 180.0, "error": None}]
+
+def test_read_sites_csv_decimal_commas_and_bom():
+    source = "﻿Breitengrad;Längengrad;Raumhöhe\n49,87;8,65;2,4\n".encode("utf-8")
+    sites = read_sites_csv(source)
+    assert sites == [{"lat": 49.87, "lon": 8.65, "raumhoehe": 2.4, "azimut": DEFAULT_AZIMUT, "error": None}]
+
+def test_read_sites_csv_optional_columns_use_defaults():
+    sites = read_sites_csv("lat,lon\n49.87,8.65\n")
+    assert sites[0]["raumhoehe"] == DEFAULT_RAUMHOEHE
+    assert sites[0]["azimut"] == DEFAULT_AZIMUT
+
+@pytest.mark.parametrize("source", ["", "\n\n", b""], ids=["leer", "leerzeilen", "bytes"])
+def test_read_sites_csv_empty(source):
+    with pytest.raises(UserError, match="leer"):
+        read_sites_csv(source)
+
+@pytest.mark.parametrize("source", ["lat;raumhoehe\n49.8;2.5\n", "stadt\nDarmstadt\n"], ids=["ohne_lon", "eine_spalte"])
+def test_read_sites_csv_missing_columns(source):
+    with pytest.raises(UserError, match="lat und lon"):
+        read_sites_csv(source)
+
+def test_read_sites_csv_flags_malformed_rows():
+    source = "lat;lon;Azimut\n49.87;8.65;90\n49.9\n49.9;abc;90\n;;\n95;8.6;90\n50.1;8.7;\n"
+    sites = read_sites_csv(source)
+    assert [site["error"] is None for site in sites] == [True, False, False, False, True]
+    assert "lon fehlt" in sites[1]["error"]
+    assert "ungültig (abc)" in sites[2]["error"]
+    assert "Bereich" in sites[3]["error"]
+    assert sites[4]["azimut"] == DEFAULT_AZIMUT
+
+
+################################################
+# Stapelauswertung                             #
+################################################
+
+@pytest.fixture
+def instant_runner(recording, memory_cache, monkeypatch):
+    calls = []
+
+    def run(formatted_params):
+        calls.append(formatted_params)
+        return recording
+    monkeypatch.setattr(hops_cache, "_hops_runner", run)
+    return calls
+
+def test_screen_sites_more_unique_sites_than_finished_jobs(instant_runner):
+    #Regression: abgeschlossene Jobs werden vom Scheduler vergessen, bevor alle Zeilen eingereicht sind
+    #Verschiedene Raumhöhen am selben Ort, jede Zeile ist eine eigene Analyse
+    sites = [{"lat": 49.87, "lon": 8.65, "raumhoehe": round(2.0 + i * 0.1, 1), "azimut": 90, "error": None}
+             for i in range(MAX_FINISHED_JOBS + 36)]
+    scheduler = InstantScheduler(max_workers=1)
+    results = list(screen_sites(sites, scheduler=scheduler))
+
+    assert len(instant_runner) == len(sites)
+    #Die ersten Jobs sind beim Auswerten schon nicht mehr im Scheduler
+    assert scheduler.get_job(analysis_key(instant_runner[0])) is None
+    assert sorted(index for index, _ in results) == list(range(len(sites)))
+    assert {row["Status"] for _, row in results} == {"fertig"}
+    table_data, column_headers = summary_table(results)
+    assert "Tragwerk" in column_headers
+    assert len(table_data) == len(sites)
+
+def test_screen_sites_reports_invalid_rows(instant_runner):
+    sites = read_sites_csv("lat;lon\n49.87;8.65\n49.87;\n49.87;8.65\n")
+    results = dict(screen_sites(sites, scheduler=HopsJobScheduler(max_workers=1)))
+    assert results[0]["Status"] == "fertig"
+    assert results[1]["Status"].startswith("Ungültige Zeile: Zeile 3")
+    assert results[2]["Status"] == "fertig"
+    #Identische Zeilen teilen sich eine Analyse
+    assert len(instant_runner) == 1
@@ -0,0 +1,186 @@
+import os
+import json
+import random
+import itertools
+
+import pytest
+from types import SimpleNamespace
+from geopandas import GeoDataFrame
+
+import app
+import gis_functions
+from geometry_utils import build_3dm_bytes, build_glb_bytes, build_glb_bytes_from_tree, iter_tree_objects
+from gltf_export import read_glb
+from gis_functions import get_gdf, get_climate_gdf, find_climate_zone, find_climate_zones
+from json_utils import HopsResponse, parse_data_string, parse_tx
+from scripts.bench_tx_parser import synthetic_tx
+from tests.conftest import make_params
+from tests.fake_hops import scaled_response
+
+
+STYLING = SimpleNamespace(opacity=0.5, line_width=1, detail="Mittel")
+DARMSTADT = (49.8728, 8.6512)
+
+
+def random_points(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.uniform(-60, 75) for _ in range(count)], [rng.uniform(-180, 180) for _ in range(count)]
+
+def triangle_count(data) -> int:
+    document, _ = read_glb(data)
+    return sum(document["accessors"][mesh["primitives"][0]["indices"]]["count"] // 3
+               for mesh in document["meshes"] if mesh["primitives"][0]["mode"] == 4)
+
+def polygon_subset(count) -> GeoDataFrame:
+    #Erste count Polygone der Rohdaten mit eigenem räumlichen Index
+    gdf = get_climate_gdf()
+    subset = gdf if count is None else gdf.iloc[:count].copy()
+    subset.sindex
+    return subset
+
+
+################################################
+# GIS: GDF, Klimazonen, GeoJSON                #
+################################################
+
+def test_get_gdf(benchmark):
+    gdf = benchmark(get_gdf, STYLING)
+    assert len(gdf) > 0
+    assert (gdf["fill-opacity"] == 0.5).all()
+
+def test_find_climate_zone_single(benchmark):
+    gdf = get_climate_gdf()
+    zone = benchmark(find_climate_zone, gdf, *DARMSTADT)
+    assert zone.startswith("Cfb")
+
+def test_find_climate_zones_batch(benchmark):
+    gdf = get_climate_gdf()
+    latitudes, longitudes = random_points(1000)
+    zones = benchmark(find_climate_zones, gdf, latitudes, longitudes)
+    assert len(zones) == 1000
+
+@pytest.mark.parametrize("polygons", [100, 1000, None], ids=["100", "1000", "alle"])
+def test_find_climate_zones_scaling(benchmark, polygons):
+    gdf = polygon_subset(polygons)
+    latitudes, longitudes = random_points(1000)
+    benchmark.extra_info["polygons"] = len(gdf)
+    zones = benchmark(find_climate_zones, gdf, latitudes, longitudes)
+    assert len(zones) == 1000
+
+@pytest.mark.parametrize("polygons", [100, 1000, None], ids=["100", "1000", "alle"])
+def test_geojson_serialization_scaling(benchmark, polygons):
+    gdf = polygon_subset(polygons)
+    benchmark.extra_info["polygons"] = len(gdf)
+    data = benchmark(gdf.to_json)
+    assert json.loads(data)["type"] == "FeatureCollection"
+
+def test_geojson_view_cold(benchmark, params):
+    #Payload wird in jeder Runde neu serialisiert
+    controller = app.Controller()
+    result = benchmark.pedantic(app.Controller.get_geojson_view, args=(controller,), kwargs={"params": params},
+                                setup=gis_functions._build_geojson_payload.cache_clear, rounds=5)
+    assert result.geojson["features"][-1]["geometry"]["type"] == "Point"
+
+def test_geojson_view_warm(benchmark, params):
+    controller = app.Controller()
+    app.Controller.get_geojson_view(controller, params=params)
+    result = benchmark(app.Controller.get_geojson_view, controller, params=params)
+    assert len(json.dumps(result.geojson)) > 0
+
+
+################################################
+# Tx Text                                      #
+################################################
+
+def test_parse_data_string_recorded(benchmark, recording):
+    text = HopsResponse(recording).text
+    parameter_data, wetterdaten = benchmark(parse_data_string, text.replace("\\r\\n", "\n").splitlines())
+    assert "Tragwerk" in parameter_data
+    assert len(wetterdaten) == 12
+
+@pytest.mark.parametrize("hourly", [False, True], ids=["monatlich", "stündlich"])
+def test_parse_tx_scaling(benchmark, hourly):
+    text = synthetic_tx(hourly=hourly)
+    result = benchmark(parse_tx, text)
+    assert len(result.parameters) == 200
+
+
+################################################
+# .3dm Aufbau und Geometrie-Views              #
+################################################
+
+@pytest.mark.parametrize("items", [10, 100, 1000])
+def test_build_3dm_scaling(benchmark, recording, items):
+    response = HopsResponse(scaled_response(recording, geometry_items=items))
+    data = benchmark(build_3dm_bytes, response.geometry)
+    assert len(data) > 0
+
+@pytest.mark.parametrize("cell_size", [0, 0.25], ids=["voll", "vereinfacht"])
+@pytest.mark.parametrize("items", [10, 100, 1000])
+def test_build_glb_scaling(benchmark, recording, items, cell_size):
+    #Vorschau aus denselben Items wie test_build_3dm_scaling, die Objekte kommen als Iterator
+    response = HopsResponse(scaled_response(recording, geometry_items=items))
+    data = benchmark(lambda: build_glb_bytes(iter_tree_objects(response.geometry), cell_size))
+    benchmark.extra_info["bytes"] = len(data)
+    document, binary = read_glb(data)
+    assert len(binary) == document["buffers"][0]["byteLength"]
+    #Erwartete Anzahl aus dem unvereinfachten Aufbau, unabhängig vom Inhalt der Aufzeichnung
+    full = triangle_count(build_glb_bytes(iter_tree_objects(response.geometry)))
+    assert full > 0
+    assert triangle_count(data) == full if not cell_size else triangle_count(data) <= full
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+def test_build_glb_decode_workers(benchmark, recording, decode_workers, workers):
+    #Vergleich seriell gegen Worker-Pool, aussagekräftig nur auf einem Rechner mit mindestens so vielen Kernen
+    #Die erste Runde startet den Pool und wird nicht gemessen
+    inner_tree = HopsResponse(scaled_response(recording, geometry_items=1000)).geometry
+    decode_workers(workers)
+    build_glb_bytes_from_tree(inner_tree)
+    benchmark.extra_info["cpus"] = os.cpu_count()
+    data = benchmark(build_glb_bytes_from_tree, inner_tree)
+    assert triangle_count(data) > 0
+
+@pytest.mark.parametrize("items", [10, 100, 1000])
+def test_response_index_scaling(benchmark, recording, items):
+    #Index aufbauen und Geometrie nachschlagen, dekodiert wird erst beim Modellaufbau
+    output = scaled_response(recording, geometry_items=items)
+    inner_tree = benchmark(lambda: HopsResponse(output).geometry)
+    assert sum(len(branch) for branch in inner_tree.values()) == items
+
+@pytest.mark.parametrize("view", ["run_grasshopper", "view_floorplan"])
+def test_geometry_view_cold(benchmark, fake_hops, clear_design_caches, params, view):
+    #Hops Ergebnis liegt im Cache, der .3dm Aufbau läuft in jeder Runde
+    controller = app.Controller()
+    getattr(app.Controller, view)(controller, params=params)
+    result = benchmark.pedantic(getattr(app.Controller, view), args=(controller,), kwargs={"params": params},
+                                setup=clear_design_caches, rounds=5)
+    assert len(result.geometry.getvalue_binary()) > 0
+    assert len(fake_hops.calls) == 1
+
+def test_preview_view_cold(benchmark, fake_hops, clear_design_caches):
+    controller = app.Controller()
+    params = make_params(modell="Vorschau (glTF)")
+    app.Controller.run_grasshopper(controller, params=params)
+    result = benchmark.pedantic(app.Controller.run_grasshopper, args=(controller,), kwargs={"params": params},
+                                setup=clear_design_caches, rounds=5)
+    document, _ = read_glb(result.geometry.getvalue_binary())
+    assert document["meshes"]
+    assert len(fake_hops.calls) == 1
+
+@pytest.mark.parametrize("view", ["run_grasshopper", "view_floorplan", "run_weather_data"])
+def test_design_view_warm(benchmark, fake_hops, memory_cache, params, view):
+    controller = app.Controller()
+    getattr(app.Controller, view)(controller, params=params)
+    benchmark(getattr(app.Controller, view), controller, params=params)
+    assert len(fake_hops.calls) == 1
+
+def test_weather_view_after_slider_change(benchmark, fake_hops, memory_cache):
+    #Misst den Weg über eine neue Pipeline und die SiteAnalysis des Standorts
+    controller = app.Controller()
+    app.Controller.run_weather_data(controller, params=make_params(raumhoehe=2.5))
+    #Jede Runde mit einer noch nicht gesehenen Raumhöhe, also einer neuen Pipeline
+    #Nach der Rundung auf 0.1 m bleibt es dieselbe Hops Analyse, die Wiederverwendung über verschiedene
+    #Analysen prüft test_design_pipeline.test_weather_is_read_once_per_location_across_settings
+    heights = itertools.count(1)
+    benchmark(lambda: app.Controller.run_weather_data(controller, params=make_params(raumhoehe=2.5 + next(heights) / 1000)))
+    assert len(fake_hops.calls) == 1
@@ -0,0 +1,65 @@
+import pytest
+
+import app
+import design_pipeline
+from design_atlas import DesignAtlas, atlas_key, open_atlas_db
+from hops_params import normalize_hops_params
+from scripts.build_atlas import store_result, write_meta, write_points_meta
+from tests.conftest import make_params
+from tests.fake_hops import DEFAULT_PARAMS
+
+
+#Repräsentativer Punkt der Zelle, bewusst weit vom Standort der Parameter entfernt
+POINT = (47.51, 7.49)
+
+
+@pytest.fixture
+def atlas(tmp_path, recording, memory_cache, monkeypatch):
+    #Atlas mit einem Entwurf für die Zelle von Darmstadt, gerechnet bei POINT
+    path = tmp_path / "atlas.sqlite"
+    connection = open_atlas_db(path)
+    write_meta(connection, 5.0, 45)
+    zone = DEFAULT_PARAMS["Klimazone"]
+    write_points_meta(connection, [(zone, *POINT)], 5.0)
+    formatted_params = normalize_hops_params(dict(DEFAULT_PARAMS, Breitangrad=POINT[0], Längengrad=POINT[1]))
+    store_result(connection, atlas_key(zone, *POINT, 2.5, 90), formatted_params, output=recording)
+    connection.close()
+
+    atlas = DesignAtlas(path)
+    monkeypatch.setattr(design_pipeline, "get_atlas", lambda: atlas)
+    return atlas
+
+
+def test_atlas_geometry_is_labelled_as_cell_approximation(fake_hops, atlas):
+    controller = app.Controller()
+    result = app.Controller.run_grasshopper(controller, params=make_params(modell="Exakt (3dm)"))
+    assert len(result.geometry.getvalue_binary()) > 0
+    #Die Geometrie kommt aus dem Atlas, ohne Hops Analyse
+    assert fake_hops.calls == []
+    note = " ".join(result.labels[0]._text)
+    assert "Näherung aus dem Entwurfsatlas" in note
+    assert "45° bis 50° Breite" in note and "47.51" in note
+    assert "Azimut 90°" in note
+
+@pytest.mark.parametrize("azimut", [90.4, 450])
+def test_atlas_matches_azimuth_as_sent_to_hops(fake_hops, atlas, azimut):
+    #Hops bekommt ganze Grad modulo 360, derselbe Wert trifft den Atlas
+    result = app.Controller.run_grasshopper(app.Controller(), params=make_params(modell="Exakt (3dm)", azimut=azimut))
+    assert fake_hops.calls == []
+    assert "Azimut 90°" in " ".join(result.labels[0]._text)
+
+@pytest.mark.parametrize("azimut", [80, 100])
+def test_atlas_is_not_used_for_azimuth_off_the_grid(fake_hops, atlas, azimut):
+    #Kein Runden auf die 45° Klasse, der Entwurf wird für den eingestellten Azimut in Hops gerechnet
+    result = app.Controller.run_grasshopper(app.Controller(), params=make_params(modell="Exakt (3dm)", azimut=azimut))
+    assert result.labels is None
+    assert len(fake_hops.calls) == 1
+    assert fake_hops.calls[0]["AzimutRichtungEingang"] == azimut
+
+def test_atlas_does_not_answer_weather(fake_hops, atlas):
+    #Die Wetterdaten gehören zum eigenen Standort, dafür wird die Analyse dort gerechnet
+    controller = app.Controller()
+    result = app.Controller.run_weather_data(controller, params=make_params())
+    assert len(result.data) == 12
+    assert len(fake_hops.calls) == 1
+    assert fake_hops.calls[0]["Breitangrad"] == 49.87
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import app
+import design_pipeline
+import geometry_utils
+from hops_params import location_key
+from tests.conftest import make_params
+
+
+def cold_pipeline(monkeypatch):
+    #Neue Pipeline und leerer Modell-Cache im Arbeitsspeicher, der Festplatten-Cache bleibt warm
+    #Die Analyse-Funktion zählt, ob das Hops Ergebnis gelesen wird
+    design_pipeline._pipelines.clear()
+    monkeypatch.setattr(geometry_utils, "_model_cache", geometry_utils.BytesLRU(geometry_utils.MODEL_CACHE_MAX_BYTES))
+    calls = []
+    pipeline = design_pipeline.get_pipeline(make_params(), analysis=lambda json_input: calls.append(json_input))
+    return pipeline, calls
+
+
+@pytest.mark.parametrize("modell", ["Exakt (3dm)", "Automatisch"])
+def test_cached_model_does_not_read_hops_output(fake_hops, memory_cache, monkeypatch, modell):
+    app.Controller.run_grasshopper(app.Controller(), params=make_params(modell=modell))
+    pipeline, calls = cold_pipeline(monkeypatch)
+
+    assert not pipeline.prefers_preview()
+    assert len(pipeline.geometry_model()) > 0
+    assert calls == []
+
+def test_automatic_mode_switches_to_preview_above_threshold(fake_hops, memory_cache, monkeypatch):
+    monkeypatch.setattr(design_pipeline, "PREVIEW_THRESHOLD", 10)
+    result = app.Controller.run_grasshopper(app.Controller(), params=make_params())
+    assert result.geometry_type == "gltf"
+    #Die Objektanzahl stammt jetzt aus dem Cache
+    pipeline, calls = cold_pipeline(monkeypatch)
+    assert pipeline.prefers_preview()
+    assert len(pipeline.geometry_preview()) > 0
+    assert calls == []
+
+def test_weather_is_read_once_per_location_across_settings(fake_hops, memory_cache, monkeypatch):
+    #Raumhöhe in Slider-Schritten und Azimut am selben Standort: Hops läuft pro Einstellung,
+    #die Wetterdaten werden nur einmal aus einer Analyse gelesen und unter dem location_key gespeichert
+    parsed = []
+    parse_text_output = design_pipeline.parse_text_output
+    monkeypatch.setattr(design_pipeline, "parse_text_output", lambda response: parsed.append(response) or parse_text_output(response))
+    stored = []
+    store = memory_cache.set
+    monkeypatch.setattr(memory_cache, "set", lambda key, data: stored.append(key) or store(key, data))
+
+    settings = [(round(2.3 + 0.1 * i, 1), 90) for i in range(5)] + [(2.5, 180), (2.5, 270)]
+    controller = app.Controller()
+    weather = []
+    for raumhoehe, azimut in settings:
+        params = make_params(raumhoehe=raumhoehe, azimut=azimut)
+        app.Controller.run_grasshopper(controller, params=params)
+        weather.append(app.Controller.run_weather_data(controller, params=params).data)
+
+    assert len({json.dumps(call, sort_keys=True) for call in fake_hops.calls}) == len(fake_hops.calls) == len(settings)
+    assert len(parsed) == 1
+    assert stored.count(location_key(49.8728, 8.6512)) == 1
+    assert all(data == weather[0] for data in weather)
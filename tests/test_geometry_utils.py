@@ -0,0 +1,20 @@
+import pytest
+
+import geometry_utils
+from geometry_utils import build_glb_bytes_from_tree
+from json_utils import HopsResponse
+from tests.fake_hops import scaled_response
+
+
+@pytest.mark.parametrize("cell_size", [0, 0.25], ids=["voll", "vereinfacht"])
+def test_parallel_preview_matches_serial(recording, decode_workers, monkeypatch, cell_size):
+    #Kleine Batches, damit die Reihenfolge über mehrere Worker hinweg geprüft wird
+    inner_tree = HopsResponse(scaled_response(recording, geometry_items=30)).geometry
+    monkeypatch.setattr(geometry_utils, "DECODE_BATCH_SIZE", 4)
+    serial = build_glb_bytes_from_tree(inner_tree, cell_size)
+
+    decode_workers(2, threshold=10)
+    parallel = build_glb_bytes_from_tree(inner_tree, cell_size)
+
+    assert geometry_utils._decode_pool is not None
+    assert parallel == serial
@@ -0,0 +1,99 @@
+import os
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hops_cache
+from hops_cache import KEY_LOCK_STRIPES, HopsDiskCache, analysis_key, cached_analysis
+from tests.fake_hops import DEFAULT_PARAMS
+
+
+def age(cache, key, seconds):
+    #Setzt die mtime eines Eintrags in die Vergangenheit, die LRU Reihenfolge hängt nur davon ab
+    path = cache._path(key)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - int(seconds * 1e9)))
+
+def temporary_files(cache):
+    return [path.name for path in cache.directory.iterdir() if path.name.startswith(".tmp-")]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = HopsDiskCache(tmp_path, max_bytes=250)
+    cache.set("a", b"a" * 100)
+    cache.set("b", b"b" * 100)
+    age(cache, "a", 20)
+    age(cache, "b", 10)
+    #Lesen macht a wieder zum jüngsten Eintrag, verdrängt wird deswegen b
+    assert cache.get("a") == b"a" * 100
+    cache.set("c", b"c" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 100
+    assert cache.get("c") == b"c" * 100
+
+def test_entry_larger_than_limit_is_not_kept(tmp_path):
+    cache = HopsDiskCache(tmp_path, max_bytes=50)
+    cache.set("gross", b"x" * 100)
+    assert cache.get("gross") is None
+
+def test_set_replaces_entry_without_temporary_files(tmp_path):
+    cache = HopsDiskCache(tmp_path)
+    cache.set("key", b"alt")
+    cache.set("key", b"neu")
+    assert cache.get("key") == b"neu"
+    assert temporary_files(cache) == []
+
+def test_failed_set_keeps_previous_entry(tmp_path, monkeypatch):
+    #Bricht das Schreiben ab, bleibt der alte Eintrag vollständig erhalten und die temporäre Datei wird entfernt
+    cache = HopsDiskCache(tmp_path)
+    cache.set("key", b"alt")
+
+    def fail(fd):
+        raise OSError("Festplatte voll")
+    monkeypatch.setattr(os, "fsync", fail)
+    with pytest.raises(OSError):
+        cache.set("key", b"neu" * 1000)
+
+    assert cache.get("key") == b"alt"
+    assert temporary_files(cache) == []
+
+def test_key_locks_use_a_fixed_set_of_files(tmp_path):
+    cache = HopsDiskCache(tmp_path)
+    for index in range(KEY_LOCK_STRIPES * 2):
+        with cache.key_lock(analysis_key({**DEFAULT_PARAMS, "Raumhöhe": index})):
+            pass
+    assert 0 < len(list((tmp_path / "locks").iterdir())) <= KEY_LOCK_STRIPES
+
+def test_corrupt_entry_is_dropped_and_recomputed(tmp_path):
+    cache = HopsDiskCache(tmp_path)
+    key = analysis_key(DEFAULT_PARAMS)
+    cache.set(key, b"kein gzip")
+    calls = []
+
+    def runner(formatted_params):
+        calls.append(formatted_params)
+        return {"values": []}
+
+    assert cached_analysis(DEFAULT_PARAMS, runner=runner, cache=cache) == {"values": []}
+    assert len(calls) == 1
+    #Der neu berechnete Eintrag ersetzt den beschädigten und wird beim nächsten Aufruf gelesen
+    assert json.loads(gzip.decompress(cache.get(key))) == {"values": []}
+    assert cached_analysis(DEFAULT_PARAMS, runner=runner, cache=cache) == {"values": []}
+    assert len(calls) == 1
+
+def test_stats_count_every_call_from_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(hops_cache, "cache_stats", {"hits": 0, "misses": 0, "runs": 0, "run_seconds": 0.0})
+    cache = HopsDiskCache(tmp_path)
+    params = [{**DEFAULT_PARAMS, "Raumhöhe": index} for index in range(8)]
+
+    def analyse(index):
+        return cached_analysis(params[index % len(params)], runner=lambda formatted_params: {"values": []}, cache=cache)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(analyse, range(400)))
+
+    stats = hops_cache.cache_stats
+    assert stats["hits"] + stats["misses"] == 400
+    assert stats["runs"] == stats["misses"] >= len(params)
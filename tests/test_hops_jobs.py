@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hops_cache
+from hops_jobs import HopsJob, HopsJobScheduler, DONE, FAILED, RUNNING
+from tests.fake_hops import DEFAULT_PARAMS
+
+
+OUTPUT = {"values": []}
+
+
+@pytest.fixture
+def runner(memory_cache, monkeypatch):
+    #Runner, der bis release.set() blockiert und seine Aufrufe mitschreibt
+    state = {"calls": [], "release": threading.Event(), "errors": []}
+
+    def run(formatted_params):
+        state["calls"].append(formatted_params)
+        state["release"].wait(5)
+        if state["errors"]:
+            raise state["errors"].pop(0)
+        return OUTPUT
+    monkeypatch.setattr(hops_cache, "_hops_runner", run)
+    return state
+
+
+def test_concurrent_submits_of_same_key_run_once(runner):
+    scheduler = HopsJobScheduler(max_workers=4)
+    with ThreadPoolExecutor(8) as pool:
+        job_ids = list(pool.map(lambda _: scheduler.submit(DEFAULT_PARAMS), range(8)))
+    assert len(set(job_ids)) == 1
+    assert scheduler.poll(job_ids[0])["status"] in ("queued", RUNNING)
+
+    runner["release"].set()
+    assert scheduler.result(job_ids[0], timeout=5) == OUTPUT
+    assert scheduler.poll(job_ids[0])["status"] == DONE
+    assert len(runner["calls"]) == 1
+
+def test_failure_is_raised_and_job_can_be_resubmitted(runner):
+    scheduler = HopsJobScheduler(max_workers=2)
+    runner["errors"].append(RuntimeError("Rhino.Compute nicht erreichbar"))
+    runner["release"].set()
+
+    job_id = scheduler.submit(DEFAULT_PARAMS)
+    with pytest.raises(RuntimeError, match="nicht erreichbar"):
+        scheduler.result(job_id, timeout=5)
+    status = scheduler.poll(job_id)
+    assert status["status"] == FAILED
+    assert "nicht erreichbar" in status["error"]
+
+    #Ein fehlgeschlagener Job wird bei erneutem Einreichen neu gestartet
+    assert scheduler.submit(DEFAULT_PARAMS) == job_id
+    assert scheduler.result(job_id, timeout=5) == OUTPUT
+    assert len(runner["calls"]) == 2
+
+def test_progress_of_running_job_without_start_time():
+    job = HopsJob("key", DEFAULT_PARAMS)
+    job.status = RUNNING
+    assert job.progress == 0.0
+    assert job.to_dict()["progress"] == 0.0
+
+def test_finished_job_keeps_no_result(runner, memory_cache):
+    #Wartende bekommen das Ergebnis direkt, danach hält der Job es nicht mehr
+    scheduler = HopsJobScheduler(max_workers=2)
+    job = scheduler.submit_job(DEFAULT_PARAMS)
+    with ThreadPoolExecutor(4) as pool:
+        waiting = [pool.submit(job.get_result, 5) for _ in range(4)]
+        runner["release"].set()
+        assert [future.result() for future in waiting] == [OUTPUT] * 4
+    assert job.status == DONE
+    assert job.result is None
+
+    #Spätere Abfragen lesen den Festplatten-Cache, Hops läuft nicht noch einmal
+    assert scheduler.result(job.key, timeout=5) == OUTPUT
+    assert len(runner["calls"]) == 1
+    assert len(memory_cache.entries) == 1